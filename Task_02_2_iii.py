@@ -1,30 +1,26 @@
-import pandas as pd
 import matplotlib.pyplot as plt
-import numpy as np
+from channels import ChannelTable
+from downsample import downsample
+from integrate import cumulative
+from loader import load_filled_data
+from segments import SEGMENT_SENSORS, route_bounds
 
 # Load the CSV file
 file_path = '/Users/frithoftangen/Library/CloudStorage/OneDrive-NTNU/PSM/Prosjekt/Gunnerus/data.csv'
-data = pd.read_csv(file_path, sep=';', header=None, names=['timestamp', 'sensor', 'value', 'unit'])
 
-# Convert the timestamp to datetime
-data['timestamp'] = pd.to_datetime(data['timestamp'])
+# Sensors used below, plus the ones the route detection needs
+sensors = ['gunnerus/RVG_mqtt/Engine1/fuel_consumption',
+           'gunnerus/RVG_mqtt/Engine3/fuel_consumption'] + SEGMENT_SENSORS
 
-# Pivot the DataFrame to get sensors as columns
-pivoted_data = data.pivot(index='timestamp', columns='sensor', values='value')
+# Load the log as a forward-filled table with sensors as columns
+filled_data = load_filled_data(file_path, fill='ffill', sensors=sensors)
 
-# Fill missing values using the forward fill method
-filled_data = pivoted_data.fillna(method='ffill')
+# Sensor values with their units, converted once on first use
+channels = ChannelTable(filled_data)
 
-# Reset the index to get timestamps as a column again
-filled_data.reset_index(inplace=True)
-
-# Extract fuel consumption for Engine 1 and Engine 3 in liters per hour
-engine1_fuel_consumption_lph = filled_data['gunnerus/RVG_mqtt/Engine1/fuel_consumption'].values  # Liters per hour
-engine3_fuel_consumption_lph = filled_data['gunnerus/RVG_mqtt/Engine3/fuel_consumption'].values  # Liters per hour
-
-# Convert liters per hour to kilograms per hour (using the density of diesel: ~0.832 Kg/L)
-engine1_fuel_consumption_kgph = engine1_fuel_consumption_lph * 0.832
-engine3_fuel_consumption_kgph = engine3_fuel_consumption_lph * 0.832
+# Fuel flow of Engine 1 and Engine 3 in kilograms per hour, at the diesel density in powertrain.py
+engine1_fuel_consumption_kgph = channels.get('gunnerus/RVG_mqtt/Engine1/fuel_consumption', 'kg/h')
+engine3_fuel_consumption_kgph = channels.get('gunnerus/RVG_mqtt/Engine3/fuel_consumption', 'kg/h')
 
 # Total fuel flow rate (kg/h)
 total_fuel_flow_kgph = engine1_fuel_consumption_kgph + engine3_fuel_consumption_kgph
@@ -33,13 +29,10 @@ total_fuel_flow_kgph = engine1_fuel_consumption_kgph + engine3_fuel_consumption_
 time_diff_minutes = (filled_data['timestamp'] - filled_data['timestamp'].iloc[0]).dt.total_seconds() / 60
 
 # Calculate cumulative fuel consumption (M_f)
-total_fuel_consumption = np.cumsum(total_fuel_flow_kgph * time_diff_minutes.diff().fillna(0) / 60)
+total_fuel_consumption = cumulative(filled_data['timestamp'], total_fuel_flow_kgph)
 
-# Define the route indices
-route_1_start = 530
-route_1_finish = 1108
-route_2_start = route_1_finish
-route_2_finish = 2660
+# Find Route 1 and Route 2 as the first two transit legs in the thruster and speed signals
+(route_1_start, route_1_finish), (route_2_start, route_2_finish) = route_bounds(filled_data)
 
 # Data for Route 1
 time_route_1 = time_diff_minutes[route_1_start:route_1_finish] - time_diff_minutes[route_1_start]
@@ -51,7 +44,8 @@ total_fuel_consumption_route_2 = total_fuel_consumption[route_2_start:route_2_fi
 
 # Plotting total fuel consumption for Route 1
 plt.figure(figsize=(12, 6))
-plt.plot(time_route_1, total_fuel_consumption_route_1, label='Total Fuel Consumption - Route 1', color='blue')
+# Series are drawn as a min/max envelope of about 2000 points, which keeps the peaks
+plt.plot(*downsample(time_route_1, total_fuel_consumption_route_1, 2000), label='Total Fuel Consumption - Route 1', color='blue')
 
 # Formatting the plot
 plt.title('Total Fuel Consumption (M_f) vs Time - Route 1')
@@ -65,7 +59,7 @@ plt.show()
 
 # Plotting total fuel consumption for Route 2
 plt.figure(figsize=(12, 6))
-plt.plot(time_route_2, total_fuel_consumption_route_2, label='Total Fuel Consumption - Route 2', color='red')
+plt.plot(*downsample(time_route_2, total_fuel_consumption_route_2, 2000), label='Total Fuel Consumption - Route 2', color='red')
 
 # Formatting the plot
 plt.title('Total Fuel Consumption (M_f) vs Time - Route 2')
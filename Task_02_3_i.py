@@ -1,59 +1,57 @@
-import pandas as pd
 import matplotlib.pyplot as plt
+from channels import ChannelTable
+from downsample import downsample
+from loader import load_filled_data
+from powertrain import ENGINE_RATING, LHV, engine_efficiency
+from segments import SEGMENT_SENSORS, route_bounds
 
 # Load the CSV file
 file_path = '/Users/frithoftangen/Library/CloudStorage/OneDrive-NTNU/PSM/Prosjekt/Gunnerus/data.csv'
-data = pd.read_csv(file_path, sep=';', header=None, names=['timestamp', 'sensor', 'value', 'unit'])
 
-# Convert the timestamp to datetime
-data['timestamp'] = pd.to_datetime(data['timestamp'])
+# Sensors used below, plus the ones the route detection needs
+sensors = ['gunnerus/RVG_mqtt/Engine1/engine_load',
+           'gunnerus/RVG_mqtt/Engine1/fuel_consumption',
+           'gunnerus/RVG_mqtt/Engine3/engine_load',
+           'gunnerus/RVG_mqtt/Engine3/fuel_consumption',
+           'gunnerus/RVG_mqtt/hcx_port_mp/LoadFeedback',
+           'gunnerus/RVG_mqtt/hcx_stbd_mp/LoadFeedback'] + SEGMENT_SENSORS
 
-# Pivot the DataFrame to get sensors as columns
-pivoted_data = data.pivot(index='timestamp', columns='sensor', values='value')
+# Load the log as a forward-filled table with sensors as columns
+filled_data = load_filled_data(file_path, fill='ffill', sensors=sensors)
 
-# Fill missing values using the forward fill method
-filled_data = pivoted_data.fillna(method='ffill')
-
-# Reset the index to get timestamps as a column again
-filled_data.reset_index(inplace=True)
+# Sensor values with their units, converted once on first use
+channels = ChannelTable(filled_data)
 
 # Q1: Extract power profiles for Engine 1 and Engine 3
 engine1_power = filled_data['gunnerus/RVG_mqtt/Engine1/engine_load'].values  # kW
 engine3_power = filled_data['gunnerus/RVG_mqtt/Engine3/engine_load'].values  # kW
 
-# Define route indices
-route_1_start = 530
-route_1_finish = 1108
-route_2_start = route_1_finish
-route_2_finish = 2660
+# Find Route 1 and Route 2 as the first two transit legs in the thruster and speed signals
+(route_1_start, route_1_finish), (route_2_start, route_2_finish) = route_bounds(filled_data)
 
 # Route 1: Calculate η_e for Engine 1 only
-engine1_x_route_1 = 100 * (engine1_power[route_1_start:route_1_finish] / 450)  # Normalized engine 1 power
-eta_e_route_1 = -0.0024 * engine1_x_route_1**2 + 0.402 * engine1_x_route_1 + 27.4382  # η_e for Engine 1 on Route 1
+eta_e_route_1 = engine_efficiency(engine1_power[route_1_start:route_1_finish])  # η_e for Engine 1 on Route 1
 
 # Route 2: Calculate η_e for combined Engine 1 and Engine 3 power
-engine_combined_x_route_2 = 100 * ((engine1_power[route_2_start:route_2_finish] + engine3_power[route_2_start:route_2_finish]) / 900)  # Normalized combined power
-eta_e_route_2 = -0.0024 * engine_combined_x_route_2**2 + 0.402 * engine_combined_x_route_2 + 27.4382  # η_e for combined engines on Route 2
+combined_power_route_2 = engine1_power[route_2_start:route_2_finish] + engine3_power[route_2_start:route_2_finish]
+eta_e_route_2 = engine_efficiency(combined_power_route_2, rating=2 * ENGINE_RATING)  # η_e for combined engines on Route 2
 
 # Q2: Extract vectors for port and starboard load feedback
-port_load_feedback = (500 / 100) * filled_data['gunnerus/RVG_mqtt/hcx_port_mp/LoadFeedback'].values
-stbd_load_feedback = (500 / 100) * filled_data['gunnerus/RVG_mqtt/hcx_stbd_mp/LoadFeedback'].values
+port_load_feedback = channels.get('gunnerus/RVG_mqtt/hcx_port_mp/LoadFeedback', 'kW')
+stbd_load_feedback = channels.get('gunnerus/RVG_mqtt/hcx_stbd_mp/LoadFeedback', 'kW')
 
 # Combine the load feedback values
 combined_load_feedback = port_load_feedback + stbd_load_feedback
 
-# Extract fuel consumption for Engine 1 and Engine 3
-engine1_fuel_consumption = filled_data['gunnerus/RVG_mqtt/Engine1/fuel_consumption'].values
-engine3_fuel_consumption = filled_data['gunnerus/RVG_mqtt/Engine3/fuel_consumption'].values
-
-# Total fuel consumption in liters per hour
-total_fuel_consumption_lph = engine1_fuel_consumption + engine3_fuel_consumption
+# Extract fuel consumption for Engine 1 and Engine 3 in kilograms per hour, at the diesel density in powertrain.py
+engine1_fuel_consumption = channels.get('gunnerus/RVG_mqtt/Engine1/fuel_consumption', 'kg/h')
+engine3_fuel_consumption = channels.get('gunnerus/RVG_mqtt/Engine3/fuel_consumption', 'kg/h')
 
-# Convert liters per hour to kilograms per hour (using the density of diesel: ~0.832 Kg/L)
-total_fuel_consumption_kgph = total_fuel_consumption_lph * 0.832
+# Total fuel consumption in kilograms per hour
+total_fuel_consumption_kgph = engine1_fuel_consumption + engine3_fuel_consumption
 
 # Calculate total energy efficiency (ηE) in percentage
-energy_density = 42 * 10**6  # Energy content of diesel fuel in J/kg
+energy_density = LHV  # Energy content of diesel fuel in J/kg
 # Total energy output in Joules (Power in Watts * time in seconds)
 total_energy_output_joules = combined_load_feedback * 10**3 * 3600  # J (from kW to J)
 # Total energy input from fuel in Joules
@@ -78,8 +76,9 @@ time_route_2 -= time_route_2.iloc[0]
 
 # Plotting for Route 1: Comparing η_e (Q1) and ηE (Q2)
 plt.figure(figsize=(12, 6))
-plt.plot(time_route_1, eta_e_route_1, label='Q1 Calculated, Engine Efficiency (η_e) - Route 1 (Engine 1 Only)', color='blue')
-plt.plot(time_route_1, total_energy_efficiency_route_1, label='Q2 Data based, Energy Efficiency (ηE) - Route 1', color='orange')
+# Series are drawn as a min/max envelope of about 2000 points, which keeps the peaks
+plt.plot(*downsample(time_route_1, eta_e_route_1, 2000), label='Q1 Calculated, Engine Efficiency (η_e) - Route 1 (Engine 1 Only)', color='blue')
+plt.plot(*downsample(time_route_1, total_energy_efficiency_route_1, 2000), label='Q2 Data based, Energy Efficiency (ηE) - Route 1', color='orange')
 plt.title('Efficiency Comparison - Route 1')
 plt.xlabel('Time (minutes from start)')
 plt.ylabel('Efficiency [%]')
@@ -89,8 +88,8 @@ plt.show()
 
 # Plotting for Route 2: Comparing η_e (Q1) and ηE (Q2)
 plt.figure(figsize=(12, 6))
-plt.plot(time_route_2, eta_e_route_2, label='Q1 Calculated, Engine Efficiency (η_e) - Route 2 (Combined Engines)', color='red')
-plt.plot(time_route_2, total_energy_efficiency_route_2, label='Q2 Data based, Energy Efficiency (ηE) - Route 2', color='green')
+plt.plot(*downsample(time_route_2, eta_e_route_2, 2000), label='Q1 Calculated, Engine Efficiency (η_e) - Route 2 (Combined Engines)', color='red')
+plt.plot(*downsample(time_route_2, total_energy_efficiency_route_2, 2000), label='Q2 Data based, Energy Efficiency (ηE) - Route 2', color='green')
 plt.title('Efficiency Comparison - Route 2')
 plt.xlabel('Time (minutes from start)')
 plt.ylabel('Efficiency [%]')
@@ -100,10 +99,10 @@ plt.show()
 
 # Combined Plot for both Routes
 plt.figure(figsize=(12, 6))
-plt.plot(time_route_1, eta_e_route_1, label='Q1 Calculated, Engine Efficiency (η_e) - Route 1 (Engine 1 Only)', color='blue')
-plt.plot(time_route_1, total_energy_efficiency_route_1, label='Q2 Data based, Energy Efficiency (ηE) - Route 1', color='orange')
-plt.plot(time_route_2 + time_route_1.iloc[-1], eta_e_route_2, label='Q1 Calculated, Engine Efficiency (η_e) - Route 2 (Combined Engines)', color='red')
-plt.plot(time_route_2 + time_route_1.iloc[-1], total_energy_efficiency_route_2, label='Q2 Data based, Energy Efficiency (ηE) - Route 2', color='green')
+plt.plot(*downsample(time_route_1, eta_e_route_1, 2000), label='Q1 Calculated, Engine Efficiency (η_e) - Route 1 (Engine 1 Only)', color='blue')
+plt.plot(*downsample(time_route_1, total_energy_efficiency_route_1, 2000), label='Q2 Data based, Energy Efficiency (ηE) - Route 1', color='orange')
+plt.plot(*downsample(time_route_2 + time_route_1.iloc[-1], eta_e_route_2, 2000), label='Q1 Calculated, Engine Efficiency (η_e) - Route 2 (Combined Engines)', color='red')
+plt.plot(*downsample(time_route_2 + time_route_1.iloc[-1], total_energy_efficiency_route_2, 2000), label='Q2 Data based, Energy Efficiency (ηE) - Route 2', color='green')
 plt.title('Efficiency Comparison - Combined Routes')
 plt.xlabel('Time (minutes from start)')
 plt.ylabel('Efficiency [%]')
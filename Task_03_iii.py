@@ -1,35 +1,27 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from channels import ChannelTable
+from downsample import downsample
+from integrate import cumulative
+from loader import load_filled_data
+from segments import SEGMENT_SENSORS, route_bounds
 
-# Load the CSV data with proper delimiter
+# Load the CSV file
 csv_file = "C:/GitHub/Gunnerus/data.csv"
-df = pd.read_csv(csv_file, delimiter=';', header=None, names=['timestamp', 'sensor', 'value', 'unit'])
 
-# Convert the 'timestamp' column to datetime format (handle time zones)
-df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+# Sensors used below, plus the ones the route detection needs
+sensors = ['gunnerus/RVG_mqtt/Engine1/fuel_consumption',
+           'gunnerus/RVG_mqtt/Engine3/fuel_consumption'] + SEGMENT_SENSORS
 
-# Drop rows where the timestamp could not be parsed
-df = df.dropna(subset=['timestamp'])
+# Load the log as a backward-filled table with sensors as columns
+filled_data = load_filled_data(csv_file, fill='bfill', sensors=sensors)
 
-# Pivot the DataFrame to get sensors as columns
-pivoted_data = df.pivot(index='timestamp', columns='sensor', values='value')
+# Sensor values with their units, converted once on first use
+channels = ChannelTable(filled_data)
 
-# Fill missing values using the backward fill method
-filled_data = pivoted_data.bfill()
-
-# Reset the index to get timestamps as a column again
-filled_data.reset_index(inplace=True)
-
-# Extract fuel consumption for Engine 1 and Engine 3 in liters per hour
-
-engine1_fuel_consumption_lph = filled_data['gunnerus/RVG_mqtt/Engine1/fuel_consumption'].astype(float).values  # Liters per hour
-engine3_fuel_consumption_lph = filled_data['gunnerus/RVG_mqtt/Engine3/fuel_consumption'].astype(float).values  # Liters per hour
-
-
-# Convert liters per hour to kilograms per hour (using the density of diesel: ~0.832 Kg/L)
-engine1_fuel_consumption_kgph = engine1_fuel_consumption_lph * 0.820
-engine3_fuel_consumption_kgph = engine3_fuel_consumption_lph * 0.820
+# Fuel flow of Engine 1 and Engine 3 in kilograms per hour, at the diesel density in powertrain.py
+engine1_fuel_consumption_kgph = channels.get('gunnerus/RVG_mqtt/Engine1/fuel_consumption', 'kg/h')
+engine3_fuel_consumption_kgph = channels.get('gunnerus/RVG_mqtt/Engine3/fuel_consumption', 'kg/h')
 
 # Calculate time differences from the start in minutes
 time_diff_minutes = (filled_data['timestamp'] - filled_data['timestamp'].iloc[0]).dt.total_seconds() / 60
@@ -39,18 +31,18 @@ time_diff_minutes = time_diff_minutes.diff().fillna(0)  # Remove NaNs from time
 total_fuel_flow_kgph = np.nan_to_num(engine1_fuel_consumption_kgph + engine3_fuel_consumption_kgph)
 
 # Calculate cumulative fuel consumption (M_f)
-total_fuel_consumption = np.cumsum(total_fuel_flow_kgph * time_diff_minutes / 60)
+total_fuel_consumption = cumulative(filled_data['timestamp'], total_fuel_flow_kgph)
 
 # Calculate the running average fuel consumption
 running_avg_fuel_consumption = np.cumsum(total_fuel_flow_kgph) / np.arange(1, len(total_fuel_flow_kgph) + 1)
 
-# Define the route indices for Route 1 and 2
-route_1_start = 530
-route_1_finish = 1108
-route_2_finish = 2660
+# Find Route 1 and Route 2 as the first two transit legs in the thruster and speed signals
+(route_1_start, route_1_finish), (route_2_start, route_2_finish) = route_bounds(filled_data)
 
-# Print average fuel consumption in kg/h for the voyage
-average_fuel_consumption = np.mean(total_fuel_flow_kgph[route_1_start:route_2_finish])
+# Print average fuel consumption in kg/h for the voyage; the two legs only, not the
+# station keeping or harbour time that can lie between them
+average_fuel_consumption = np.concatenate([total_fuel_flow_kgph[route_1_start:route_1_finish],
+                                           total_fuel_flow_kgph[route_2_start:route_2_finish]]).mean()
 average_fuel_consumption_tot = np.mean(total_fuel_flow_kgph)
 print(f'Average fuel consumption for Route 1 and Route 2: {average_fuel_consumption:.2f} kg per hour')
 print(f'Average fuel consumption for Total trip: {average_fuel_consumption_tot:.2f} kg per hour')
@@ -62,8 +54,9 @@ print(f'Which mean the ship could sail for {(Total_sailtime)/24:.0f} days')
 
 #print(total_fuel_flow_kgph.max())
 
+# Series are drawn as a min/max envelope of about 2000 points, which keeps the peaks
 plt.figure(figsize=(12, 6))
-plt.plot(time_diff_minutes.cumsum(), total_fuel_consumption, label='Total Fuel Consumption', color='blue')
+plt.plot(*downsample(time_diff_minutes.cumsum(), total_fuel_consumption, 2000), label='Total Fuel Consumption', color='blue')
 
 # Plot formatting
 plt.title('Total Fuel Consumption vs Time for the Entire Trip')
@@ -73,7 +66,7 @@ plt.legend()
 plt.tight_layout()
 
 # Running average fuel consumption over time
-plt.plot(time_diff_minutes.cumsum(), running_avg_fuel_consumption, label='Running Average Fuel Consumption', color='orange', linestyle='--')
+plt.plot(*downsample(time_diff_minutes.cumsum(), running_avg_fuel_consumption, 2000), label='Running Average Fuel Consumption', color='orange', linestyle='--')
 
 # Plot formatting
 plt.title('Total and Running Average Fuel Consumption Over Time')
@@ -84,8 +77,8 @@ plt.tight_layout()
 
 # Plotting fuel consumption for Route 2
 plt.figure(figsize=(12, 6))
-plt.plot(time_diff_minutes.cumsum()[route_1_finish:route_2_finish], 
-         total_fuel_consumption[route_1_finish:route_2_finish], 
+plt.plot(*downsample(time_diff_minutes.cumsum()[route_2_start:route_2_finish],
+                     total_fuel_consumption[route_2_start:route_2_finish], 2000),
          label='Fuel Consumption - Route 2', color='green')
 
 # Plot formatting
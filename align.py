@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+from instrument import profiled
+
+# 'last': value as of each grid instant (last reading at or before it)
+# 'mean': mean of the readings in the interval ending at each grid instant
+ALIGN_METHODS = ('last', 'mean')
+
+
+def to_ns(step):
+    # '1s', '500ms', pd.Timedelta or a plain number of nanoseconds
+    if isinstance(step, (int, np.integer)):
+        return int(step)
+    return int(pd.Timedelta(step).value)
+
+
+def instant_ns(instant):
+    # Epoch nanoseconds of a timestamp; naive timestamps are taken as UTC
+    if isinstance(instant, (int, np.integer)):
+        return int(instant)
+    instant = pd.Timestamp(instant)
+    if instant.tzinfo is None:
+        instant = instant.tz_localize('UTC')
+    return int(instant.as_unit('ns').value)
+
+
+def ffill_columns(wide, time=None, limit=None):
+    # Forward fill NaNs down each column of a 2-D array. With the row times
+    # (int64 ns) and a limit, a value is held at most limit ns after its row.
+    # limit may be one per column as an array of ns, inf for no limit.
+    valid = ~np.isnan(wide)
+    source = np.where(valid, np.arange(len(wide))[:, None], 0)
+    np.maximum.accumulate(source, axis=0, out=source)
+    filled = np.take_along_axis(wide, source, axis=0)
+    # Leading NaNs stay NaN: row 0 is only a valid source where it holds data
+    filled[~np.maximum.accumulate(valid, axis=0)] = np.nan
+    if limit is not None:
+        limit = limit if isinstance(limit, np.ndarray) else to_ns(limit)
+        filled[time[:, None] - time[source] > limit] = np.nan
+    return filled
+
+
+def bfill_columns(wide, time=None, limit=None):
+    # Backward fill, the mirror image of ffill_columns
+    reverse = None if time is None else -time[::-1]
+    return ffill_columns(wide[::-1], reverse, limit)[::-1]
+
+
+def make_grid(time, step_ns, start=None, end=None):
+    # Grid instants are multiples of the step covering [start, end]
+    if start is None:
+        start = time.min() // step_ns * step_ns
+    if end is None:
+        end = -(-time.max() // step_ns) * step_ns
+    return np.arange(start, end + 1, step_ns, dtype=np.int64)
+
+
+def align(log, step='1s', how='last', start=None, end=None, staleness=None):
+    # Put every sensor of a SensorLog on a uniform time grid in one pass over the rows.
+    # Returns the grid (int64 epoch ns) and a (grid x sensor-code) array.
+    # staleness: with how='last', how long a reading is carried forward at most,
+    # one limit or an array of ns per sensor code.
+    if how not in ALIGN_METHODS:
+        raise ValueError(f"how must be one of {ALIGN_METHODS}, got {how!r}")
+    step_ns = to_ns(step)
+    n_sensors = len(log.registry)
+    if len(log) == 0:
+        return np.empty(0, np.int64), np.empty((0, n_sensors), log.value.dtype)
+
+    start = None if start is None else instant_ns(start)
+    end = None if end is None else instant_ns(end)
+    grid = make_grid(log.time, step_ns, start, end)
+
+    time, code, value = log.time, log.code, log.value
+    if np.any(np.diff(time) < 0):
+        order = np.argsort(time, kind='stable')
+        time, code, value = time[order], code[order], value[order]
+
+    # Each reading belongs to the first grid instant at or after it
+    keep = ~np.isnan(value) & (time <= grid[-1])
+    if how == 'mean':
+        keep &= time > grid[0] - step_ns
+    time, code, value = time[keep], code[keep], value[keep]
+    bucket = np.clip(-(-(time - grid[0]) // step_ns), 0, None)
+    key = bucket * n_sensors + code
+
+    if how == 'mean':
+        size = len(grid) * n_sensors
+        counts = np.bincount(key, minlength=size)
+        sums = np.bincount(key, weights=value, minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            wide = (sums / counts).astype(log.value.dtype, copy=False)
+        return grid, wide.reshape(len(grid), n_sensors)
+
+    # Last reading per (grid instant, sensor), then carried forward as-of
+    _, first_from_end = np.unique(key[::-1], return_index=True)
+    last = len(key) - 1 - first_from_end
+    wide = np.full((len(grid), n_sensors), np.nan, dtype=log.value.dtype)
+    wide[bucket[last], code[last]] = value[last]
+    return grid, ffill_columns(wide, grid, staleness)
+
+
+@profiled('align', rows=len)
+def aligned_frame(log, step='1s', how='last', start=None, end=None, staleness=None):
+    # Aligned data in the same layout as the scripts' filled_data table
+    grid, wide = align(log, step, how, start, end, staleness)
+    columns = log.registry.sorted_codes()
+    frame = pd.DataFrame(wide[:, columns],
+                         columns=pd.Index([log.registry.names[c] for c in columns], name='sensor'))
+    frame.insert(0, 'timestamp', pd.to_datetime(grid, utc=True))
+    return frame
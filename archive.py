@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from align import instant_ns
+from loader import CHUNK_SIZE, TimestampReport, encode_chunk, read_log_chunks
+from quality import QualityReport, quality_flags
+from registry import SensorRegistry, SensorSelection
+from rollup import ROLLUP_DTYPE, ROLLUP_RESOLUTIONS, merge_record, rollup, rollup_stats
+from sensorlog import SensorLog
+
+# Layout of an archive directory:
+#   index.json          sensor name -> file stem, unit, sample count, first/last time
+#   <stem>.time         int64 epoch ns, ascending
+#   <stem>.value        float64 readings, same length as the time file
+#   <stem>.rollup_<res> ROLLUP_DTYPE records per 1s/1min/1h bucket, written on append
+ARCHIVE_VERSION = 1
+INDEX_FILE = 'index.json'
+TIME_DTYPE = np.int64
+VALUE_DTYPE = np.float64
+
+
+class SensorArchive:
+    # Append-only per-sensor archive, read through numpy.memmap so a time range
+    # of one sensor only touches the pages holding that range
+
+    def __init__(self, directory):
+        self.directory = directory
+        index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            if index.get('version') != ARCHIVE_VERSION:
+                raise ValueError(f"{directory}: unsupported archive version {index.get('version')}")
+            self.sensors = index['sensors']
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.sensors = {}
+
+    @property
+    def names(self):
+        return sorted(self.sensors)
+
+    def unit(self, name):
+        return self.sensors[name]['unit']
+
+    def __len__(self):
+        return sum(entry['count'] for entry in self.sensors.values())
+
+    def _path(self, name, kind):
+        return os.path.join(self.directory, f"{self.sensors[name]['file']}.{kind}")
+
+    def _write_index(self):
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump({'version': ARCHIVE_VERSION, 'sensors': self.sensors}, f, indent=2)
+        os.replace(index_path + '.tmp', index_path)
+
+    def append(self, log):
+        # Append a SensorLog. Readings must not be older than what is already archived.
+        order = np.lexsort((log.time, log.code))
+        code = log.code[order]
+        groups = [rows for rows in np.split(order, np.flatnonzero(np.diff(code)) + 1) if len(rows)]
+
+        # Check every sensor before writing anything
+        for rows in groups:
+            name = log.registry.names[log.code[rows[0]]]
+            entry = self.sensors.get(name)
+            if entry is not None and log.time[rows[0]] < entry['last']:
+                raise ValueError(f"{name}: reading at {log.time[rows[0]]} is older than the archived data "
+                                 f"(last {entry['last']})")
+
+        for rows in groups:
+            sensor_code = log.code[rows[0]]
+            name = log.registry.names[sensor_code]
+            time = log.time[rows].astype(TIME_DTYPE, copy=False)
+            value = log.value[rows].astype(VALUE_DTYPE, copy=False)
+
+            entry = self.sensors.get(name)
+            if entry is None:
+                entry = {'file': f'sensor_{len(self.sensors):04d}', 'unit': log.registry.units[sensor_code],
+                         'count': 0, 'first': int(time[0]), 'last': int(time[0])}
+                self.sensors[name] = entry
+
+            # Truncate to the indexed length first, dropping any half-written tail
+            for kind, data in (('time', time), ('value', value)):
+                with open(self._path(name, kind), 'ab') as f:
+                    f.truncate(entry['count'] * data.itemsize)
+                    data.tofile(f)
+            entry['count'] += len(time)
+            entry['last'] = int(time[-1])
+            self._append_rollups(name, entry, time, value)
+
+        self._write_index()
+
+    def _append_rollups(self, name, entry, time, value):
+        # Extend the rollups with new readings; only the last stored bucket can overlap them
+        if 'rollups' not in entry:
+            # Sensor archived before rollups existed: build them from every reading
+            time, value = self.series(name)
+            entry['rollups'] = {}
+        counts = entry['rollups']
+        for label, resolution in ROLLUP_RESOLUTIONS.items():
+            records = rollup(time, value, resolution)
+            count = counts.get(label, 0)
+            with open(self._path(name, f'rollup_{label}'), 'r+b' if count else 'wb') as f:
+                f.truncate(count * ROLLUP_DTYPE.itemsize)
+                if count and len(records):
+                    f.seek((count - 1) * ROLLUP_DTYPE.itemsize)
+                    previous = np.frombuffer(f.read(ROLLUP_DTYPE.itemsize), ROLLUP_DTYPE)[0]
+                    if previous['start'] == records[0]['start']:
+                        records[0] = merge_record(previous, records[0])
+                        count -= 1
+                        f.seek(count * ROLLUP_DTYPE.itemsize)
+                f.seek(count * ROLLUP_DTYPE.itemsize)
+                records.tofile(f)
+            counts[label] = count + len(records)
+
+    def rollups(self, name, label):
+        # Memory-mapped rollup records of one sensor at one resolution
+        count = self.sensors[name].get('rollups', {}).get(label, 0)
+        if count == 0:
+            return np.empty(0, ROLLUP_DTYPE)
+        return np.memmap(self._path(name, f'rollup_{label}'), dtype=ROLLUP_DTYPE, mode='r', shape=(count,))
+
+    def stats(self, name, start=None, end=None):
+        # count/sum/mean/min/max/last of one sensor over [start, end), see rollup.rollup_stats
+        return rollup_stats(self, name, start, end)
+
+    def series(self, name):
+        # Memory-mapped time and value arrays of one sensor
+        count = self.sensors[name]['count']
+        if count == 0:
+            return np.empty(0, TIME_DTYPE), np.empty(0, VALUE_DTYPE)
+        time = np.memmap(self._path(name, 'time'), dtype=TIME_DTYPE, mode='r', shape=(count,))
+        value = np.memmap(self._path(name, 'value'), dtype=VALUE_DTYPE, mode='r', shape=(count,))
+        return time, value
+
+    def slice(self, name, start=None, end=None):
+        # Readings of one sensor with start <= time <= end, found by binary search
+        time, value = self.series(name)
+        lo = 0 if start is None else np.searchsorted(time, instant_ns(start), side='left')
+        hi = len(time) if end is None else np.searchsorted(time, instant_ns(end), side='right')
+        return time[lo:hi], value[lo:hi]
+
+    def to_log(self, sensors=None, start=None, end=None):
+        # Gather a time range of the selected sensors into a SensorLog for alignment
+        selection = SensorSelection(sensors)
+        registry = SensorRegistry()
+        pieces = []
+        for name in self.names:
+            if not selection(name):
+                continue
+            time, value = self.slice(name, start, end)
+            code = registry.code(name, self.unit(name))
+            pieces.append((np.array(time), np.full(len(time), code, dtype=np.int32), np.array(value)))
+        log = SensorLog.concatenate(registry, pieces, VALUE_DTYPE)
+        order = np.argsort(log.time, kind='stable')
+        return log.take(order)
+
+
+def convert(file_path, directory, chunksize=CHUNK_SIZE):
+    # Stream a timestamp;sensor;value;unit log into an archive, one chunk at a time
+    archive = SensorArchive(directory)
+    registry = SensorRegistry()
+    report = TimestampReport()
+    # Quality is checked per chunk, so gaps and stuck runs across chunk edges go unflagged
+    quality = QualityReport()
+    for chunk in read_log_chunks(file_path, chunksize):
+        time, code, value = encode_chunk(chunk, registry, report, VALUE_DTYPE)
+        log = SensorLog(registry, time, code, value)
+        quality.add(log, quality_flags(log))
+        archive.append(log)
+    report.warn(file_path)
+    quality.warn(file_path)
+    return archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a Gunnerus sensor log (CSV) to a binary archive')
+    parser.add_argument('csv_file')
+    parser.add_argument('archive_dir')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    archive = convert(args.csv_file, args.archive_dir, args.chunksize)
+    print(f'Archived {len(archive)} readings of {len(archive.sensors)} sensors to {args.archive_dir}')
+
+
+if __name__ == '__main__':
+    main()
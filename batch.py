@@ -0,0 +1,149 @@
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from loader import expand_paths, load_aligned_data
+from performance import ENGINES, PERFORMANCE_SENSORS, POWER, engine_columns, engine_sensor
+from powertrain import ETA_CHAIN, LHV, powertrain_model
+from segments import SEGMENT_SENSORS, SPEED, TRANSIT, segment
+from timestamps import column_ns
+from voyage import Voyage, derived_channels
+
+THRUSTER_LOAD_SENSORS = ['gunnerus/RVG_mqtt/hcx_port_mp/LoadFeedback', 'gunnerus/RVG_mqtt/hcx_stbd_mp/LoadFeedback']
+
+# Everything the summary reads, so each voyage is parsed once for all metric families
+BATCH_SENSORS = sorted(set(PERFORMANCE_SENSORS + THRUSTER_LOAD_SENSORS + SEGMENT_SENSORS))
+
+# Columns of the summary table, one row per voyage and one per segment
+SUMMARY_COLUMNS = [
+    'voyage', 'segment', 'mode', 'route', 'start', 'end', 'hours', 'distance_nm',
+    'fuel_kg', 'model_fuel_kg', 'co2_kg', 'propulsion_kwh', 'genset_kwh',
+    'mean_fuel_kgph', 'mean_propulsion_kw', 'mean_genset_kw', 'std_propulsion_kw',
+    'energy_efficiency_pct', 'model_eta_p_pct', 'sfc_g_per_kwh', 'fuel_kg_per_nm',
+]
+
+
+def voyage_channels(frame):
+    # Voyage channels plus the powertrain model's fuel flow and the ship speed
+    channels = derived_channels(frame)
+    engines = [engine for engine in ENGINES if engine_sensor(engine, POWER) in frame]
+    if engines:
+        channels['model_fuel'] = powertrain_model(np.nan_to_num(engine_columns(frame, POWER, engines))).fuel_flow
+    else:
+        channels['model_fuel'] = np.zeros(len(frame))
+    channels['speed'] = frame[SPEED].to_numpy(dtype=np.float64) if SPEED in frame else np.zeros(len(frame))
+    return channels
+
+
+def window_rows(stats):
+    # Summary columns from Voyage.windows() results, one dict per window
+    fuel, model_fuel, co2 = stats['fuel'], stats['model_fuel'], stats['co2']
+    propulsion, genset, speed = stats['propulsion_power'], stats['genset_power'], stats['speed']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        columns = {
+            'hours': fuel.hours,
+            'distance_nm': speed.total,
+            'fuel_kg': fuel.total,
+            'model_fuel_kg': model_fuel.total,
+            'co2_kg': co2.total,
+            'propulsion_kwh': propulsion.total,
+            'genset_kwh': genset.total,
+            'mean_fuel_kgph': fuel.mean,
+            'mean_propulsion_kw': propulsion.mean,
+            'mean_genset_kw': genset.mean,
+            'std_propulsion_kw': np.sqrt(propulsion.var),
+            # Propulsion energy out over fuel energy in, as Task_02_2_iv.py per sample
+            'energy_efficiency_pct': propulsion.total * 3.6e6 / (fuel.total * LHV) * 100,
+            # Energy-weighted η_p of the powertrain model
+            'model_eta_p_pct': genset.total * ETA_CHAIN * 3.6e6 / (model_fuel.total * LHV) * 100,
+            'sfc_g_per_kwh': fuel.total * 1000 / genset.total,
+            'fuel_kg_per_nm': fuel.total / speed.total,
+        }
+    return [{name: float(values[i]) for name, values in columns.items()} for i in range(len(fuel.total))]
+
+
+def summarize(frame, name):
+    # Summary rows of one voyage table: the whole voyage, then every segment
+    voyage = Voyage(column_ns(frame['timestamp']), voyage_channels(frame))
+    time = frame['timestamp']
+    rows = [dict(voyage=name, segment=0, mode='voyage', route=None, start=time.iloc[0], end=time.iloc[-1])]
+    try:
+        segments = segment(frame)
+    except KeyError:
+        # No thruster signals to segment by
+        segments = []
+    route = 0
+    for i, seg in enumerate(segments, start=1):
+        if seg.mode == TRANSIT:
+            route += 1
+        rows.append(dict(voyage=name, segment=i, mode=seg.mode, route=route if seg.mode == TRANSIT else None,
+                         start=seg.start, end=seg.end))
+
+    starts = [row['start'] for row in rows]
+    ends = [row['end'] for row in rows]
+    for row, metrics in zip(rows, window_rows(voyage.windows(starts, ends))):
+        row.update(metrics)
+    return rows
+
+
+def voyage_name(path):
+    return os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+
+
+def voyage_paths(path):
+    # Voyages under a directory: every *.csv file directly in it, and every
+    # subdirectory of *.csv files (one voyage spread over several logs)
+    if not os.path.isdir(path):
+        return expand_paths(path)
+    voyages = sorted(glob.glob(os.path.join(path, '*.csv')))
+    voyages += sorted(entry for entry in glob.glob(os.path.join(path, '*'))
+                      if os.path.isdir(entry) and glob.glob(os.path.join(entry, '*.csv')))
+    if not voyages:
+        raise FileNotFoundError(f"No voyages found in {path!r}")
+    return voyages
+
+
+def summarize_voyage(path, step='1s', cache=False):
+    # Parse one voyage once, on a uniform grid, and summarize it
+    # cache: keep the aligned table next to the log, off so a batch run leaves no files behind
+    frame = load_aligned_data(path, step=step, sensors=BATCH_SENSORS, workers=1, cache=cache)
+    if len(frame) == 0:
+        return []
+    return summarize(frame, voyage_name(path))
+
+
+def summarize_voyages(path, step='1s', workers=None, cache=False):
+    # Summary table of every voyage under path, one voyage per worker process
+    voyages = voyage_paths(path) if not isinstance(path, (list, tuple)) else list(path)
+    if workers == 1 or len(voyages) == 1:
+        results = [summarize_voyage(voyage, step, cache) for voyage in voyages]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(summarize_voyage, voyages, [step] * len(voyages), [cache] * len(voyages)))
+    return pd.DataFrame([row for rows in results for row in rows], columns=SUMMARY_COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fuel, energy, efficiency and CO2 summary of Gunnerus voyages')
+    parser.add_argument('path', nargs='+', help='voyage log files, or a directory of voyages')
+    parser.add_argument('--out', default='summary.csv')
+    parser.add_argument('--step', default='1s', help='time grid the logs are aligned to')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache', action='store_true', help='cache the aligned tables next to the logs')
+    args = parser.parse_args()
+
+    path = args.path[0] if len(args.path) == 1 else args.path
+    summary = summarize_voyages(path, args.step, args.workers, args.cache)
+    summary.to_csv(args.out, index=False)
+
+    voyages = summary[summary['mode'] == 'voyage']
+    print(f"{len(voyages)} voyages, {summary['route'].notna().sum()} routes, written to {args.out}")
+    print(voyages[['voyage', 'hours', 'fuel_kg', 'co2_kg', 'energy_efficiency_pct']].to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
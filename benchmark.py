@@ -0,0 +1,340 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from align import aligned_frame
+from derived import DerivedChannels
+from downsample import downsample
+from figures import FigureJob, PLOT_POINTS, render
+from instrument import enable, peak_rss_mb
+from loader import fill_wide, read_log, read_log_chunks
+from performance import engine_performance
+from timestamps import column_ns, to_epoch_ns
+from voyage import Voyage
+
+# Sensors of data_liten.csv with their unit and mean publish interval in seconds.
+# Sensors seen once in the sample publish on change only and are given 20 s.
+SENSORS = {
+    'hcx_port_mp/LoadFeedback': ('%', 1.0),
+    'hcx_port_mp/RPMFeedback': ('%', 1.06),
+    'hcx_stbd_mp/LoadFeedback': ('%', 1.06),
+    'hcx_stbd_mp/RPMFeedback': ('%', 1.33),
+    'Engine1/boost_pressure': ('bar', 5.14),
+    'Engine1/engine_load': ('kilowatt', 3.27),
+    'Engine1/engine_speed': ('rpm', 2.77),
+    'Engine1/exhaust_temperature1': ('celsius', 1.89),
+    'Engine1/exhaust_temperature2': ('celsius', 4.0),
+    'Engine1/fuel_consumption': ('l/h', 1.16),
+    'Engine1/lube_oil_pressure': ('bar', 20.0),
+    'Engine1/lube_oil_temperature': ('celsius', 20.0),
+    'Engine2/boost_pressure': ('bar', 20.0),
+    'Engine2/coolant_temperature': ('celsius', 20.0),
+    'Engine2/engine_load': ('kilowatt', 20.0),
+    'Engine2/engine_speed': ('rpm', 20.0),
+    'Engine2/exhaust_temperature1': ('celsius', 3.6),
+    'Engine2/exhaust_temperature2': ('celsius', 5.14),
+    'Engine2/fuel_consumption': ('l/h', 20.0),
+    'Engine2/lube_oil_pressure': ('bar', 20.0),
+    'Engine2/lube_oil_temperature': ('celsius', 20.0),
+    'Engine3/boost_pressure': ('bar', 7.2),
+    'Engine3/coolant_temperature': ('celsius', 20.0),
+    'Engine3/engine_load': ('kilowatt', 2.57),
+    'Engine3/engine_speed': ('rpm', 1.8),
+    'Engine3/exhaust_temperature1': ('celsius', 1.5),
+    'Engine3/exhaust_temperature2': ('celsius', 1.57),
+    'Engine3/fuel_consumption': ('l/h', 1.03),
+    'Engine3/lube_oil_pressure': ('bar', 20.0),
+    'Engine3/lube_oil_temperature': ('celsius', 18.0),
+    'SeapathGPSVtg/SpeedKmHr': ('Km/H', 20.0),
+    'SeapathGPSVtg/SpeedKnots': ('knots', 20.0),
+}
+PREFIX = 'gunnerus/RVG_mqtt/'
+
+# One synthetic voyage cycle: (seconds, thruster load in %, speed in knots)
+PHASES = [(600, 2.0, 0.05), (3000, 40.0, 9.0), (600, 12.0, 0.3), (2400, 40.0, 9.0), (600, 2.0, 0.05)]
+
+START = '2024-09-10T06:00:00'
+
+# Seconds of log generated at a time, about 500 000 rows
+BLOCK_SECONDS = 50_000
+
+# Shape of the gamma distribution of publish intervals; 1 would be a Poisson process
+JITTER = 6
+
+DEFAULT_ROWS = (10**4, 10**5, 10**6)
+
+STAGES = ('csv_parse', 'timestamp_parse', 'ingest', 'pivot', 'align', 'fill',
+          'metrics', 'integration', 'plot')
+
+
+def _phase(seconds):
+    # Thruster load and speed of the voyage cycle at each second from the start
+    bounds = np.cumsum([phase[0] for phase in PHASES])
+    index = np.searchsorted(bounds, seconds % bounds[-1], side='right')
+    load = np.array([phase[1] for phase in PHASES])[index]
+    speed = np.array([phase[2] for phase in PHASES])[index]
+    return load, speed
+
+
+def synthetic_values(quantity, seconds, rng):
+    # Plausible readings of one sensor at the given seconds from the start
+    load, speed = _phase(seconds)
+    noise = rng.normal(0, 1, len(seconds))
+    engine, _, name = quantity.partition('/')
+    if engine == 'Engine2' and not name.startswith('exhaust'):
+        return np.zeros(len(seconds))
+    engine_load = 30 + 4 * load + noise
+    if name == 'LoadFeedback':
+        return np.clip(load + noise, 0, 100)
+    if name == 'RPMFeedback':
+        return np.clip(1.5 * load + noise, 0, 100)
+    if name == 'engine_load':
+        return engine_load
+    if name == 'fuel_consumption':
+        return 0.25 * engine_load + 0.1 * noise
+    if name == 'engine_speed':
+        return 1800 + 2 * noise
+    if name == 'boost_pressure':
+        return 1 + engine_load / 50
+    if name.startswith('exhaust'):
+        return 42 + 0.1 * noise if engine == 'Engine2' else 150 + 1.5 * engine_load
+    if name == 'lube_oil_pressure':
+        return 4.4 + 0.01 * noise
+    if name.endswith('temperature'):
+        return 85 + 0.1 * noise
+    if name == 'SpeedKnots':
+        return speed + 0.1 * np.abs(noise)
+    if name == 'SpeedKmHr':
+        return (speed + 0.1 * np.abs(noise)) * 1.852
+    return noise
+
+
+def publish_times(rng, first, interval, end):
+    # Publish instants from first up to end, with intervals jittered around the mean.
+    # Gamma intervals (shape JITTER) are irregular without the long silences of a Poisson process.
+    n = int((end - first) / interval * 1.5) + 10
+    times = first + np.cumsum(np.r_[0.0, rng.gamma(JITTER, interval / JITTER, n)])
+    while times[-1] < end:
+        times = np.r_[times, times[-1] + np.cumsum(rng.gamma(JITTER, interval / JITTER, n))]
+    cut = np.searchsorted(times, end)
+    return times[:cut], times[cut]
+
+
+def synthetic_log(file_path, rows, seed=0):
+    # Write a timestamp;sensor;value;unit log of `rows` rows shaped like data_liten.csv:
+    # the same sensors and units, each publishing at irregular instants at its own rate
+    rng = np.random.default_rng(seed)
+    names = list(SENSORS)
+    sensors = np.array([PREFIX + name for name in names], dtype=object)
+    units = np.array([SENSORS[name][0] for name in names], dtype=object)
+    start_ns = pd.Timestamp(START).value
+    # Next publish instant of each sensor, in seconds from the start
+    next_time = rng.uniform(0, [SENSORS[name][1] for name in names])
+    written = 0
+    block = 0
+    with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+        while written < rows:
+            end = (block + 1) * BLOCK_SECONDS
+            pieces = []
+            for i, name in enumerate(names):
+                seconds, next_time[i] = publish_times(rng, next_time[i], SENSORS[name][1], end)
+                pieces.append((seconds, np.full(len(seconds), i), synthetic_values(name, seconds, rng)))
+            seconds = np.concatenate([piece[0] for piece in pieces])
+            code = np.concatenate([piece[1] for piece in pieces])
+            value = np.concatenate([piece[2] for piece in pieces])
+            order = np.argsort(seconds, kind='stable')[:rows - written]
+            seconds, code, value = seconds[order], code[order], value[order]
+
+            epoch_ns = start_ns + np.round(seconds * 1e9).astype(np.int64)
+            stamps = np.datetime_as_string(epoch_ns.astype('datetime64[ns]'), unit='ns')
+            pd.DataFrame({
+                'timestamp': np.char.add(stamps, 'Z'),
+                'sensor': sensors[code],
+                'value': value,
+                'unit': units[code],
+            }).to_csv(f, sep=';', header=False, index=False, lineterminator='\r\n')
+            written += len(order)
+            block += 1
+    return file_path
+
+
+def synthetic_path(data_dir, rows, seed=0):
+    # Synthetic logs are kept between runs, one per size and seed
+    os.makedirs(data_dir, exist_ok=True)
+    file_path = os.path.join(data_dir, f'synthetic_{rows}_{seed}.csv')
+    if not os.path.exists(file_path):
+        synthetic_log(file_path + '.tmp', rows, seed)
+        os.replace(file_path + '.tmp', file_path)
+    return file_path
+
+
+class StageTimer:
+    # Wall time, rows and peak RSS after each stage
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, name, seconds, rows):
+        self.stages[name] = {'seconds': seconds, 'rows': int(rows),
+                             'rows_per_s': rows / seconds if seconds > 0 else None,
+                             'peak_rss_mb': peak_rss_mb()}
+
+    def time(self, name, rows, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.record(name, time.perf_counter() - start, rows(result) if callable(rows) else rows)
+        return result
+
+
+def run_pipeline(file_path, step='1s', plot_dir=None):
+    # Time every stage of ingest -> pivot/align -> fill -> metrics -> integrate -> plot on one log
+    warnings.simplefilter('ignore')
+    timer = StageTimer()
+
+    # CSV parse and timestamp parse, timed separately over one streaming pass
+    csv_seconds = timestamp_seconds = 0.0
+    rows = 0
+    chunks = iter(read_log_chunks(file_path))
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        csv_seconds += time.perf_counter() - start
+        if chunk is None:
+            break
+        start = time.perf_counter()
+        to_epoch_ns(chunk['timestamp'].to_numpy())
+        timestamp_seconds += time.perf_counter() - start
+        rows += len(chunk)
+    timer.record('csv_parse', csv_seconds, rows)
+    timer.record('timestamp_parse', timestamp_seconds, rows)
+
+    # The whole ingest as the scripts run it: parse, encode and quality flags
+    log = timer.time('ingest', rows, read_log, file_path)
+    wide = timer.time('pivot', len(log), log.pivot)
+    timer.time('align', len(log), aligned_frame, log, step)
+    filled = timer.time('fill', len(wide), lambda: fill_wide(wide, 'ffill').reset_index())
+
+    def metrics():
+        derived = DerivedChannels(filled)
+        derived.get('total_energy_efficiency')
+        derived.get('eta_p')
+        return engine_performance(filled)
+
+    timer.time('metrics', len(filled), metrics)
+
+    def integration():
+        voyage = Voyage.from_frame(filled)
+        voyage.window()
+        return voyage.cumulative('fuel')
+
+    fuel_mass = timer.time('integration', len(filled), integration)
+
+    def plot():
+        minutes = (column_ns(filled['timestamp']) - column_ns(filled['timestamp'])[0]) / 60e9
+        x, y = downsample(minutes, fuel_mass, PLOT_POINTS)
+        job = FigureJob(os.path.join(plot_dir, 'fuel_mass.png'), 'Cumulative fuel consumption',
+                        'Fuel Consumption (kg)', [(x, y, 'Fuel', 'blue')], None)
+        return render(job)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        plot_dir = plot_dir or tmp_dir
+        timer.time('plot', len(filled), plot)
+
+    return {'rows': rows, 'file_mb': os.path.getsize(file_path) / 2**20,
+            'peak_rss_mb': peak_rss_mb(), 'stages': timer.stages}
+
+
+def revision():
+    # Git revision of the tree being measured, None outside a checkout
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=here, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=here,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def run_benchmarks(sizes=DEFAULT_ROWS, data_dir=None, seed=0, step='1s', profile=None):
+    # One result per log size; each size runs in a fresh process so its peak RSS is its own.
+    # profile: also write the pipeline's own stage records there, see instrument.py
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), 'gunnerus_benchmark')
+    commit, dirty = revision()
+    report = {
+        'revision': commit, 'dirty': dirty,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+        'platform': platform.platform(), 'step': step, 'runs': [],
+    }
+    if profile:
+        enable(profile)
+    for rows in sizes:
+        file_path = synthetic_path(data_dir, rows, seed)
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            report['runs'].append(pool.submit(run_pipeline, file_path, step).result())
+    return report
+
+
+def compare(report, baseline):
+    # Lines of seconds per stage against a baseline report, per log size
+    lines = []
+    old_runs = {run['rows']: run for run in baseline['runs']}
+    for run in report['runs']:
+        old = old_runs.get(run['rows'])
+        if old is None:
+            continue
+        lines.append(f"{run['rows']} rows vs {(baseline.get('revision') or '?')[:10]}:")
+        for name, stage in run['stages'].items():
+            if name in old['stages'] and old['stages'][name]['seconds'] > 0:
+                ratio = stage['seconds'] / old['stages'][name]['seconds']
+                lines.append(f"  {name:16s} {stage['seconds']:9.3f} s  x{ratio:5.2f}")
+        if run['peak_rss_mb'] and old['peak_rss_mb']:
+            ratio = run['peak_rss_mb'] / old['peak_rss_mb']
+            lines.append(f"  {'peak RSS':16s} {run['peak_rss_mb']:9.1f} MB x{ratio:5.2f}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the ingest -> pivot -> metrics -> plot pipeline '
+                                                 'on synthetic Gunnerus logs')
+    parser.add_argument('--rows', type=float, nargs='+', default=DEFAULT_ROWS,
+                        help='log sizes in rows, e.g. 1e4 1e6 1e8')
+    parser.add_argument('--out', default='benchmark.json')
+    parser.add_argument('--data-dir', help='where the synthetic logs are kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--step', default='1s', help='grid of the align stage')
+    parser.add_argument('--compare', help='earlier benchmark JSON to compare against')
+    parser.add_argument('--profile', help='also record the stages inside the pipeline to this file '
+                                          '(.jsonl, or .json for a Chrome trace)')
+    args = parser.parse_args()
+
+    report = run_benchmarks([int(rows) for rows in args.rows], args.data_dir, args.seed, args.step,
+                            args.profile)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for run in report['runs']:
+        peak = f"{run['peak_rss_mb']:.1f} MB" if run['peak_rss_mb'] is not None else 'unknown'
+        print(f"{run['rows']} rows, {run['file_mb']:.1f} MB, peak RSS {peak}")
+        for name, stage in run['stages'].items():
+            rate = f"{stage['rows_per_s']:12.0f} rows/s" if stage['rows_per_s'] else ''
+            print(f"  {name:16s} {stage['seconds']:9.3f} s {rate}")
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(report, json.load(f))))
+    print(f'Saved to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
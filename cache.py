@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import warnings
+
+import pandas as pd
+
+from instrument import stage
+
+try:
+    import pyarrow  # noqa: F401  Parquet support
+except ImportError:
+    pyarrow = None
+
+# Bump when the layout of the cached tables changes
+CACHE_VERSION = 3
+
+# Block size used when hashing the source file
+HASH_BLOCK = 1 << 20
+
+
+def file_fingerprint(file_path):
+    stat = os.stat(file_path)
+    return {'path': os.path.abspath(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def file_hash(file_paths):
+    # Content hash of one file or of several files in order
+    if isinstance(file_paths, (str, os.PathLike)):
+        file_paths = [file_paths]
+    digest = hashlib.blake2b(digest_size=16)
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_paths(anchor, tag):
+    # The cache lives next to the source, e.g. data.csv.cache.ffill.parquet
+    base = f'{anchor}.cache.{tag}'
+    suffix = '.parquet' if pyarrow is not None else '.pkl'
+    return base + suffix, base + '.json'
+
+
+def _read_table(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def _write_table(table, path):
+    tmp_path = path + '.tmp'
+    if path.endswith('.parquet'):
+        table.to_parquet(tmp_path, index=False)
+    else:
+        table.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta, meta_path):
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, meta_path)
+
+
+def _sources(file_paths):
+    if isinstance(file_paths, (str, os.PathLike)):
+        return [file_paths]
+    return list(file_paths)
+
+
+def lookup(file_paths, tag, anchor=None):
+    # Return the cached table built from file_paths, or None if it is missing or stale.
+    # The cache is stored next to anchor, which defaults to the first source file.
+    sources = _sources(file_paths)
+    table_path, meta_path = cache_paths(anchor or sources[0], tag)
+    meta = _read_meta(meta_path)
+    if meta is None or not os.path.exists(table_path):
+        return None
+    if meta.get('version') != CACHE_VERSION or meta.get('tag') != tag:
+        return None
+
+    fingerprints = [file_fingerprint(source) for source in sources]
+    cached = meta.get('files', [])
+    if [(f['path'], f['size']) for f in fingerprints] != [(f['path'], f['size']) for f in cached]:
+        return None
+
+    # Same files and sizes but touched since: only trust the cache if the content is unchanged
+    if fingerprints != cached:
+        if file_hash(sources) != meta.get('hash'):
+            return None
+        meta['files'] = fingerprints
+        try:
+            _write_meta(meta, meta_path)
+        except OSError:
+            pass
+
+    return _read_table(table_path)
+
+
+def store(file_paths, tag, table, anchor=None):
+    sources = _sources(file_paths)
+    table_path, meta_path = cache_paths(anchor or sources[0], tag)
+    meta = {'version': CACHE_VERSION, 'tag': tag, 'hash': file_hash(sources),
+            'files': [file_fingerprint(source) for source in sources]}
+    try:
+        _write_table(table, table_path)
+        _write_meta(meta, meta_path)
+    except OSError as error:
+        warnings.warn(f"Could not write cache {table_path}: {error}")
+
+
+def cached_table(file_paths, tag, build, anchor=None):
+    # Load the table from the cache, or build it with build() and cache the result
+    with stage('cache_lookup', tag=tag) as timing:
+        table = lookup(file_paths, tag, anchor)
+        timing.rows = None if table is None else len(table)
+    if table is None:
+        with stage('build', tag=tag) as timing:
+            table = build()
+            timing.rows = len(table)
+        with stage('cache_store', rows=len(table), tag=tag):
+            store(file_paths, tag, table, anchor)
+    return table
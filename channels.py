@@ -0,0 +1,200 @@
+from collections import namedtuple
+
+import numpy as np
+
+from powertrain import FUEL_DENSITY, THRUSTER_RATING
+
+# Every unit as (SI unit, scale, offset): value in SI = value * scale + offset.
+# The logger's own spellings ('kilowatt', 'celsius', 'Km/H') are included.
+UNITS = {
+    # power
+    'W': ('W', 1.0, 0.0),
+    'kW': ('W', 1e3, 0.0),
+    'kilowatt': ('W', 1e3, 0.0),
+    # energy
+    'J': ('J', 1.0, 0.0),
+    'kJ': ('J', 1e3, 0.0),
+    'MJ': ('J', 1e6, 0.0),
+    'kWh': ('J', 3.6e6, 0.0),
+    # mass and mass flow
+    'kg': ('kg', 1.0, 0.0),
+    'g': ('kg', 1e-3, 0.0),
+    'kg/s': ('kg/s', 1.0, 0.0),
+    'kg/h': ('kg/s', 1 / 3600, 0.0),
+    'g/s': ('kg/s', 1e-3, 0.0),
+    # volume flow
+    'm3/s': ('m3/s', 1.0, 0.0),
+    'l/h': ('m3/s', 1e-3 / 3600, 0.0),
+    # specific energy and specific fuel consumption
+    'J/kg': ('J/kg', 1.0, 0.0),
+    'MJ/kg': ('J/kg', 1e6, 0.0),
+    'kg/J': ('kg/J', 1.0, 0.0),
+    'g/kJ': ('kg/J', 1e-6, 0.0),
+    'g/kWh': ('kg/J', 1e-3 / 3.6e6, 0.0),
+    # pressure
+    'Pa': ('Pa', 1.0, 0.0),
+    'bar': ('Pa', 1e5, 0.0),
+    # temperature
+    'K': ('K', 1.0, 0.0),
+    'celsius': ('K', 1.0, 273.15),
+    # speed
+    'm/s': ('m/s', 1.0, 0.0),
+    'knots': ('m/s', 1852 / 3600, 0.0),
+    'Km/H': ('m/s', 1 / 3.6, 0.0),
+    # rotational speed in revolutions
+    '1/s': ('1/s', 1.0, 0.0),
+    'rpm': ('1/s', 1 / 60, 0.0),
+    # ratios
+    '1': ('1', 1.0, 0.0),
+    '%': ('1', 1e-2, 0.0),
+}
+
+# Unit the logger reports each quantity in, by the last part of the sensor name.
+# Used for tables that no longer carry the log's unit column.
+SENSOR_UNITS = {
+    'engine_load': 'kilowatt',
+    'fuel_consumption': 'l/h',
+    'engine_speed': 'rpm',
+    'boost_pressure': 'bar',
+    'lube_oil_pressure': 'bar',
+    'exhaust_temperature1': 'celsius',
+    'exhaust_temperature2': 'celsius',
+    'coolant_temperature': 'celsius',
+    'lube_oil_temperature': 'celsius',
+    'LoadFeedback': '%',
+    'RPMFeedback': '%',
+    'SpeedKnots': 'knots',
+    'SpeedKmHr': 'Km/H',
+}
+
+# One sensor and how its readings become SI: si = reading * scale + offset
+Channel = namedtuple('Channel', ['sensor', 'unit', 'si_unit', 'scale', 'offset'])
+
+
+def rated_scales(fuel_density=FUEL_DENSITY, thruster_rating=THRUSTER_RATING):
+    # Quantities whose reading only becomes a physical quantity with a rated scale:
+    # quantity -> (logged unit, SI unit, scale from the logged unit)
+    return {
+        'LoadFeedback': ('%', 'W', thruster_rating * 1e3 / 100),  # share of the thruster rating in kW
+        'fuel_consumption': ('l/h', 'kg/s', fuel_density / 3600),  # diesel at fuel_density kg/L
+    }
+
+
+def quantity(sensor):
+    return sensor.rsplit('/', 1)[-1]
+
+
+def unit_factor(unit, to_unit):
+    # (scale, offset) converting values in unit to to_unit
+    if unit == to_unit:
+        return 1.0, 0.0
+    si_unit, scale, offset = UNITS[unit]
+    to_si_unit, to_scale, to_offset = UNITS[to_unit]
+    if si_unit != to_si_unit:
+        raise ValueError(f"Cannot convert {unit} ({si_unit}) to {to_unit} ({to_si_unit})")
+    return scale / to_scale, (offset - to_offset) / to_scale
+
+
+def convert(values, unit, to_unit):
+    # Values in unit expressed in to_unit, e.g. convert(power, 'kW', 'W')
+    scale, offset = unit_factor(unit, to_unit)
+    values = np.asarray(values, dtype=np.float64) * scale
+    if offset:
+        values += offset
+    return values
+
+
+class ChannelRegistry:
+    # Unit and rated scale of every sensor, so readings turn into SI values with
+    # one multiply-add each. Units come from the log where known (see
+    # from_sensors) and from SENSOR_UNITS otherwise.
+
+    def __init__(self, units=None, rated=None):
+        self.units = dict(units or {})
+        self.rated = rated_scales() if rated is None else rated
+        self._channels = {}
+
+    @classmethod
+    def from_sensors(cls, registry, rated=None):
+        # Units as logged, from a loader SensorRegistry
+        return cls({name: unit for name, unit in zip(registry.names, registry.units) if unit}, rated)
+
+    def unit(self, sensor):
+        unit = self.units.get(sensor) or SENSOR_UNITS.get(quantity(sensor))
+        if unit is None:
+            raise KeyError(f"No unit known for {sensor!r}")
+        return unit.strip()
+
+    def channel(self, sensor):
+        channel = self._channels.get(sensor)
+        if channel is None:
+            unit = self.unit(sensor)
+            rated_unit, si_unit, scale = self.rated.get(quantity(sensor), (None, None, None))
+            if unit == rated_unit:
+                channel = Channel(sensor, unit, si_unit, scale, 0.0)
+            else:
+                si_unit, scale, offset = UNITS.get(unit, (unit, 1.0, 0.0))
+                channel = Channel(sensor, unit, si_unit, scale, offset)
+            self._channels[sensor] = channel
+        return channel
+
+    def factors(self, sensors, units=None):
+        # Scale and offset vectors taking each sensor's readings to SI, or to the given units
+        channels = [self.channel(sensor) for sensor in sensors]
+        scale = np.array([channel.scale for channel in channels])
+        offset = np.array([channel.offset for channel in channels])
+        if units is not None:
+            for i, (channel, unit) in enumerate(zip(channels, units)):
+                to_scale, to_offset = unit_factor(channel.si_unit, unit)
+                scale[i] *= to_scale
+                offset[i] = offset[i] * to_scale + to_offset
+        return scale, offset
+
+    def materialize(self, frame, sensors, units=None):
+        # (rows x sensors) array of the sensors' columns in SI (or the given units),
+        # converted in one fused pass over the block
+        scale, offset = self.factors(sensors, units)
+        block = np.multiply(frame[list(sensors)].to_numpy(dtype=np.float64), scale)
+        if offset.any():
+            np.add(block, offset, out=block)
+        return block
+
+
+class ChannelTable:
+    # SI values of a filled/aligned table's sensors, converted on first use and kept.
+    # Columns asked for together are converted together. With usable cells given
+    # (see loader.usable_cells) the other cells read as NaN.
+
+    def __init__(self, frame, registry=None, usable=None):
+        self.frame = frame
+        self.registry = registry or ChannelRegistry()
+        self.usable = usable
+        self._values = {}
+
+    def __contains__(self, sensor):
+        return sensor in self.frame
+
+    def si(self, *sensors):
+        # SI arrays of the sensors, one per sensor
+        missing = [sensor for sensor in dict.fromkeys(sensors) if sensor not in self._values]
+        if missing:
+            block = self.registry.materialize(self.frame, missing)
+            if self.usable is not None:
+                block[~self.usable[missing].to_numpy(dtype=bool)] = np.nan
+            for i, sensor in enumerate(missing):
+                self._values[sensor] = block[:, i]
+        return [self._values[sensor] for sensor in sensors]
+
+    def get(self, sensor, unit=None):
+        # Values of one sensor in SI, or converted to unit, e.g. get(fuel, 'kg/h')
+        values, = self.si(sensor)
+        if unit is None:
+            return values
+        return convert(values, self.registry.channel(sensor).si_unit, unit)
+
+    def unit(self, sensor):
+        return self.registry.channel(sensor).si_unit
+
+    def forget(self, sensor):
+        # Drop the converted values of a sensor, e.g. after its column changed
+        self._values.pop(sensor, None)
@@ -0,0 +1,228 @@
+from collections import namedtuple
+
+import numpy as np
+
+from align import instant_ns
+from channels import ChannelTable, convert
+from instrument import stage
+from integrate import cumulative
+from performance import engine_sensor
+from powertrain import LHV, powertrain_model
+from segments import THRUSTER_LOAD
+from timestamps import column_ns
+
+# The two generator sets running on the logged voyages, as in the Task scripts
+MAIN_ENGINES = ('Engine1', 'Engine3')
+
+# A derived channel: the channels or sensors it is computed from, the function
+# computing it from their values (in that order) and its unit. Pointwise channels
+# are computed row by row, so a window of one is that window of the whole table;
+# the others (running sums, time from start) are computed within the window.
+Node = namedtuple('Node', ['inputs', 'compute', 'unit', 'pointwise'])
+
+# Every derived channel by name. Names that are not in here are sensors, read in
+# SI units through a ChannelTable, or 'time' (int64 epoch ns).
+DERIVED = {}
+
+
+def derived(name, inputs, unit, pointwise=True):
+    # Register the decorated function as derived channel `name`
+    def register(compute):
+        DERIVED[name] = Node(tuple(inputs), compute, unit, pointwise)
+        return compute
+    return register
+
+
+@derived('minutes', ['time'], 'min', pointwise=False)
+def _minutes(time):
+    # Minutes from the start of the window
+    return (time - time[0]) / 60e9
+
+
+@derived('port_load_feedback', [THRUSTER_LOAD[0]], 'kW')
+def _port_load_feedback(load):
+    return convert(load, 'W', 'kW')
+
+
+@derived('stbd_load_feedback', [THRUSTER_LOAD[1]], 'kW')
+def _stbd_load_feedback(load):
+    return convert(load, 'W', 'kW')
+
+
+@derived('combined_load_feedback', ['port_load_feedback', 'stbd_load_feedback'], 'kW')
+def _combined_load_feedback(port, stbd):
+    return port + stbd
+
+
+def _engine_channels(engine):
+    number = engine[len('Engine'):]
+
+    @derived(f'engine{number}_power', [engine_sensor(engine, 'engine_load')], 'kW')
+    def _power(power):
+        return convert(power, 'W', 'kW')
+
+    @derived(f'engine{number}_fuel_consumption_kgph', [engine_sensor(engine, 'fuel_consumption')], 'kg/h')
+    def _fuel(fuel):
+        return convert(fuel, 'kg/s', 'kg/h')
+
+
+for _engine in MAIN_ENGINES:
+    _engine_channels(_engine)
+
+
+@derived('combined_power', ['engine1_power', 'engine3_power'], 'kW')
+def _combined_power(engine1, engine3):
+    return engine1 + engine3
+
+
+@derived('total_fuel_consumption_kgph', ['engine1_fuel_consumption_kgph', 'engine3_fuel_consumption_kgph'], 'kg/h')
+def _total_fuel(engine1, engine3):
+    return engine1 + engine3
+
+
+@derived('powertrain', ['engine1_power', 'engine3_power'], None)
+def _powertrain(engine1, engine3):
+    # PowertrainResult of the two engines, see powertrain.powertrain_model
+    return powertrain_model([engine1, engine3])
+
+
+@derived('eta_e', ['powertrain'], '%')
+def _eta_e(powertrain):
+    return powertrain.combined_eta_e
+
+
+@derived('eta_p', ['powertrain'], '%')
+def _eta_p(powertrain):
+    return powertrain.eta_p
+
+
+@derived('M_f', ['powertrain'], 'kg/h')
+def _model_fuel_flow(powertrain):
+    return powertrain.fuel_flow
+
+
+@derived('total_energy_efficiency', ['combined_load_feedback', 'total_fuel_consumption_kgph'], '%')
+def _total_energy_efficiency(propulsion_power, fuel_flow):
+    # Propulsion energy out over fuel energy in, per row
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return propulsion_power * 3.6e6 / (fuel_flow * LHV) * 100
+
+
+@derived('fuel_mass', ['time', 'total_fuel_consumption_kgph'], 'kg', pointwise=False)
+def _fuel_mass(time, fuel_flow):
+    # Fuel burnt since the start of the window
+    return cumulative(time, np.nan_to_num(fuel_flow))
+
+
+@derived('model_fuel_mass', ['time', 'M_f'], 'kg', pointwise=False)
+def _model_fuel_mass(time, fuel_flow):
+    return cumulative(time, np.nan_to_num(fuel_flow))
+
+
+def _rows(value, start, stop):
+    # Rows start:stop of a channel value; tuples such as PowertrainResult per field
+    if isinstance(value, tuple):
+        return type(value)(*(field[start:stop] for field in value))
+    return value[start:stop]
+
+
+class DerivedChannels:
+    # Derived channels of one filled/aligned table, computed only when asked for
+    # and kept per time window. Asking for a channel computes just the channels it
+    # depends on, for that window; a pointwise channel already computed for the
+    # whole table is sliced instead. invalidate() drops a channel and everything
+    # computed from it once its inputs change.
+
+    def __init__(self, frame, channels=None, nodes=DERIVED, usable=None):
+        # usable: cells of the table metrics may use, see loader.usable_cells
+        self.frame = frame
+        self.channels = channels or ChannelTable(frame, usable=usable)
+        self.nodes = nodes
+        self._memo = {}
+        self.evaluations = 0
+
+    def __contains__(self, name):
+        return name in self.nodes or name == 'time' or name in self.frame
+
+    def unit(self, name):
+        if name in self.nodes:
+            return self.nodes[name].unit
+        return 'ns' if name == 'time' else self.channels.unit(name)
+
+    def _time(self):
+        key = ('time', None)
+        if key not in self._memo:
+            self._memo[key] = column_ns(self.frame['timestamp'])
+        return self._memo[key]
+
+    def window(self, window):
+        # Window as (start, stop) rows. None is the whole table; (start, stop) rows,
+        # as from segments.route_bounds, are kept; a Segment or anything else with
+        # start and end times covers the rows from start up to end.
+        if window is None:
+            return None
+        if hasattr(window, 'start') and hasattr(window, 'end'):
+            time = self._time()
+            start, stop = np.searchsorted(time, [instant_ns(window.start), instant_ns(window.end)], side='left')
+            return int(start), int(stop)
+        start, stop = window
+        return int(start), int(stop)
+
+    def get(self, name, window=None):
+        # Value of a channel over a window
+        return self._get(name, self.window(window))
+
+    def _get(self, name, window):
+        key = (name, window)
+        if key in self._memo:
+            return self._memo[key]
+        node = self.nodes.get(name)
+        if window is not None and (node is None or node.pointwise):
+            # Sensors and pointwise channels: the window of the whole-table value
+            # if there is one, otherwise computed on the window alone
+            whole = self._memo.get((name, None))
+            if whole is None and node is None:
+                whole = self._get(name, None)
+            if whole is not None:
+                value = _rows(whole, *window)
+                self._memo[key] = value
+                return value
+        if node is None:
+            value = self._time() if name == 'time' else self.channels.get(name)
+        else:
+            # Sensors read by the same channel are converted together
+            sensors = [source for source in node.inputs if source not in self.nodes and source != 'time']
+            if len(sensors) > 1:
+                self.channels.si(*sensors)
+            inputs = [self._get(source, window) for source in node.inputs]
+            with stage('derived', channel=name):
+                value = node.compute(*inputs)
+            self.evaluations += 1
+        self._memo[key] = value
+        return value
+
+    def dependents(self, names):
+        # The names plus every derived channel computed from any of them
+        found = set(names)
+        changed = True
+        while changed:
+            changed = False
+            for name, node in self.nodes.items():
+                if name not in found and found.intersection(node.inputs):
+                    found.add(name)
+                    changed = True
+        return found
+
+    def invalidate(self, *names):
+        # Forget the values of the named channels or sensors, in every window,
+        # and of every channel depending on them
+        stale = self.dependents(names)
+        self._memo = {key: value for key, value in self._memo.items() if key[0] not in stale}
+        for name in names:
+            self.channels.forget(name)
+        return stale
+
+    def update(self, sensor, values):
+        # Replace a sensor column of the table and invalidate what depends on it
+        self.frame[sensor] = values
+        self.invalidate(sensor)
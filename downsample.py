@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from integrate import time_ns
+
+# 'minmax': lowest and highest point of each x bucket, so every peak survives
+# 'lttb': largest triangle three buckets, one point per bucket that keeps the visual shape
+DOWNSAMPLE_METHODS = ('minmax', 'lttb')
+
+
+def _numeric(x):
+    # x as float64 for bucketing; timestamps as epoch ns
+    if isinstance(x, (pd.Series, pd.Index)) and pd.api.types.is_datetime64_any_dtype(x.dtype):
+        return time_ns(x).astype(np.float64)
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def minmax_indices(x, y, n_buckets):
+    # Rows of the minimum and maximum y in each of n_buckets equal x ranges, in x order.
+    # NaN readings are never picked.
+    x, y = _numeric(x), np.asarray(y, dtype=np.float64)
+    rows = np.flatnonzero(~np.isnan(y) & ~np.isnan(x))
+    if len(rows) <= 2 * n_buckets:
+        return rows
+    lo, hi = x[rows[0]], x[rows[-1]]
+    bucket = np.minimum(((x[rows] - lo) / ((hi - lo) or 1) * n_buckets).astype(np.int64), n_buckets - 1)
+    # Sorted by bucket then y: the first row of a bucket holds its minimum, the last its maximum
+    order = np.lexsort((y[rows], bucket))
+    rows, bucket = rows[order], bucket[order]
+    first = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    last = np.r_[first[1:] - 1, len(rows) - 1]
+    return np.unique(np.concatenate([rows[first], rows[last]]))
+
+
+def lttb_indices(x, y, n_out):
+    # Largest triangle three buckets: keep the first and last point, and from each
+    # bucket in between the point spanning the largest triangle with the point kept
+    # before it and the mean of the next bucket
+    x, y = _numeric(x), np.asarray(y, dtype=np.float64)
+    rows = np.flatnonzero(~np.isnan(y) & ~np.isnan(x))
+    if n_out >= len(rows) or n_out < 3:
+        return rows
+    xs, ys = x[rows], y[rows]
+    edges = np.linspace(1, len(rows) - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, len(rows) - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        following = slice(end, edges[i + 2]) if i + 2 < len(edges) else slice(len(rows) - 1, len(rows))
+        mean_x, mean_y = xs[following].mean(), ys[following].mean()
+        area = np.abs((xs[previous] - mean_x) * (ys[start:end] - ys[previous])
+                      - (xs[previous] - xs[start:end]) * (mean_y - ys[previous]))
+        previous = start + int(area.argmax())
+        keep[i + 1] = previous
+    return rows[keep]
+
+
+def downsample_indices(x, y, n_out, method='minmax'):
+    # Rows to draw so that about n_out points remain
+    if method == 'minmax':
+        return minmax_indices(x, y, max(n_out // 2, 1))
+    if method == 'lttb':
+        return lttb_indices(x, y, n_out)
+    raise ValueError(f"method must be one of {DOWNSAMPLE_METHODS}, got {method!r}")
+
+
+def downsample(x, y, n_out, method='minmax'):
+    # x and y reduced to about n_out points, e.g. two per pixel column of a plot.
+    # Series keep their type and index.
+    if len(y) <= n_out:
+        return x, y
+    rows = downsample_indices(x, y, n_out, method)
+    return _take(x, rows), _take(y, rows)
+
+
+def _take(values, rows):
+    if isinstance(values, pd.Series):
+        return values.iloc[rows]
+    return np.asarray(values)[rows] if not isinstance(values, pd.Index) else values[rows]
+
+
+def plot_points(figure_width, dpi, per_pixel=2):
+    # Points worth drawing across a figure of the given width in inches
+    return int(figure_width * dpi * per_pixel)
@@ -0,0 +1,290 @@
+import argparse
+import hashlib
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch import BATCH_SENSORS, THRUSTER_LOAD_SENSORS, voyage_name, voyage_paths
+from downsample import downsample, plot_points
+from instrument import profiled, stage
+from integrate import cumulative
+from loader import load_aligned_data
+from performance import ENGINES, FUEL, POWER, engine_columns, engine_sensor
+from powertrain import FUEL_DENSITY, LHV, THRUSTER_RATING, powertrain_model
+from segments import route_bounds
+from timestamps import column_ns
+
+# Bump when the rendering code changes in a way that should redraw every figure
+FIGURE_VERSION = 2
+MANIFEST = '.figures.json'
+FIGSIZE = (12, 6)
+DPI = 100
+
+# Lines are reduced to about two points per pixel column before drawing
+DOWNSAMPLE = 'minmax'
+PLOT_POINTS = plot_points(FIGSIZE[0], DPI)
+
+# One figure per view of a spec, saved as <name>_<view>.png like the set in Bilder/.
+# series are (metric, label, color); views are route_1, route_2, combined
+# (route 2 drawn after route 1) and voyage (the whole log).
+FigureSpec = namedtuple('FigureSpec', ['title', 'ylabel', 'series', 'views'])
+
+ROUTES = ('route_1', 'route_2')
+WITH_COMBINED = ROUTES + ('combined',)
+
+FIGURES = {
+    'Propultion_Thruster_plot': FigureSpec(
+        'Thruster Power Over Time', 'Load Feedback (kW)',
+        (('propulsion_power', 'Combined Load Feedback', 'green'), ('port_thruster', 'Port Load Feedback', 'blue'),
+         ('stbd_thruster', 'Starboard Load Feedback', 'orange')), ROUTES),
+    'Efficiency_plot_calculated': FigureSpec(
+        'Engine Efficiency (η_e) vs Time', 'Efficiency η_e [%]',
+        (('eta_e', 'Engine Efficiency (η_e)', 'blue'),), WITH_COMBINED),
+    'Fuelconsumption_kg_per_h_calculated_plot': FigureSpec(
+        'Fuel Consumption (M_f) vs Time', 'Fuel Consumption (kg/h)',
+        (('model_fuel_flow', 'Calculated Fuel Consumption (M_f)', 'blue'),), WITH_COMBINED),
+    'Total_fuelconsumption_kg_per_h_calculated_plot': FigureSpec(
+        'Total Calculated Fuel Consumption (M_f) vs Time', 'Fuel Consumption (kg)',
+        (('model_fuel_mass', 'Calculated Fuel Consumption (M_f)', 'blue'),), ROUTES),
+    'Genset_power_plot': FigureSpec(
+        'Generated Power by Each DG and Total Supply Power', 'Power [kW]',
+        (('engine1_power', 'Engine 1 Load', 'blue'), ('engine3_power', 'Engine 3 Load', 'orange'),
+         ('genset_power', 'Total Supply Power', 'green')), ROUTES),
+    'Fuel_flowrate_plot': FigureSpec(
+        'Fuel Flow Rate (Qf) vs Time', 'Fuel Flow Rate [Kg/h]',
+        (('engine1_fuel_flow', 'Engine 1 Fuel Flow', 'blue'), ('engine3_fuel_flow', 'Engine 3 Fuel Flow', 'orange'),
+         ('fuel_flow', 'Total Fuel Flow', 'green')), ROUTES),
+    'Total_fuel_consumption_plot': FigureSpec(
+        'Total Fuel Consumption (M_f) vs Time', 'Total Fuel Consumption [Kg]',
+        (('fuel_mass', 'Total Fuel Consumption', 'blue'),), ROUTES),
+    'Energy_efficiency_fuel_to_propultion': FigureSpec(
+        'Total Energy Efficiency Over Time', 'Energy Efficiency [%]',
+        (('energy_efficiency', 'Total Energy Efficiency', 'blue'),), WITH_COMBINED),
+    'Efficiency_plot': FigureSpec(
+        'Total Power Efficiency (η_p) vs Time', 'Efficiency η_p [%]',
+        (('eta_p', 'Total Power Efficiency (η_p)', 'blue'),), ROUTES),
+    'Comparison_efficiency_plot': FigureSpec(
+        'Efficiency Comparison', 'Efficiency [%]',
+        (('eta_e', 'Q1 Calculated, Engine Efficiency (η_e)', 'blue'),
+         ('energy_efficiency', 'Q2 Data based, Energy Efficiency (ηE)', 'orange')), WITH_COMBINED),
+    'Comparison_fuel_flow_plot': FigureSpec(
+        'Fuel Consumption Comparison', 'Fuel Consumption (kg/h)',
+        (('model_fuel_flow', 'Q1 Calculated, Fuel Consumption (M_f)', 'blue'),
+         ('fuel_flow', 'Q2 Data based, Fuel Consumption (Q_f)', 'orange')), WITH_COMBINED),
+    'Fuelconsumption_plot': FigureSpec(
+        'Total Fuel Consumption (M_f) vs Time', 'Total Fuel Consumption [Kg]',
+        (('fuel_mass', 'Total Fuel Consumption', 'purple'),), ('combined', 'voyage')),
+}
+
+# Running totals start from 0 at the start of a route, and a combined view
+# carries route 1's total on into route 2
+CUMULATIVE = {'fuel_mass', 'model_fuel_mass'}
+
+# A rendered figure: output file, spec fields and the arrays to draw.
+# lines are (x, y, label, color); transition marks where route 2 starts.
+FigureJob = namedtuple('FigureJob', ['path', 'title', 'ylabel', 'lines', 'transition'])
+
+
+@profiled('figure_metrics')
+def figure_metrics(frame):
+    # Every series the figure specs refer to, from one filled/aligned table
+    def column(name):
+        return np.nan_to_num(frame[name].to_numpy(dtype=np.float64)) if name in frame else np.zeros(len(frame))
+
+    time = column_ns(frame['timestamp'])
+    engines = [engine for engine in ENGINES if engine_sensor(engine, POWER) in frame]
+    power = np.nan_to_num(engine_columns(frame, POWER, engines))
+    fuel_flow_each = np.nan_to_num(engine_columns(frame, FUEL, engines)) * FUEL_DENSITY
+    powertrain = powertrain_model(power)
+
+    metrics = {
+        'minutes': (time - time[0]) / 60e9,
+        'port_thruster': column(THRUSTER_LOAD_SENSORS[0]) * THRUSTER_RATING / 100,
+        'stbd_thruster': column(THRUSTER_LOAD_SENSORS[1]) * THRUSTER_RATING / 100,
+        'genset_power': power.sum(axis=1),
+        'fuel_flow': fuel_flow_each.sum(axis=1),
+        'eta_e': powertrain.combined_eta_e,
+        'eta_p': powertrain.eta_p,
+        'model_fuel_flow': powertrain.fuel_flow,
+    }
+    for i, engine in enumerate(engines):
+        metrics[f'{engine.lower()}_power'] = power[:, i]
+        metrics[f'{engine.lower()}_fuel_flow'] = fuel_flow_each[:, i]
+    metrics['propulsion_power'] = metrics['port_thruster'] + metrics['stbd_thruster']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        metrics['energy_efficiency'] = metrics['propulsion_power'] * 3.6e6 / (metrics['fuel_flow'] * LHV) * 100
+    metrics['fuel_mass'] = cumulative(time, metrics['fuel_flow'])
+    metrics['model_fuel_mass'] = cumulative(time, metrics['model_fuel_flow'])
+    return metrics
+
+
+def view_lines(metrics, spec, view, routes):
+    # Lines of one view of a spec, and the x where route 2 starts in a combined view
+    if view == 'voyage':
+        rows = [slice(None)]
+    elif view == 'combined':
+        rows = [slice(start, finish) for start, finish in routes]
+    else:
+        start, finish = routes[ROUTES.index(view)]
+        rows = [slice(start, finish)]
+
+    lines, offset, transition, carried = [], 0.0, None, {}
+    for n, part in enumerate(rows, start=1):
+        minutes = metrics['minutes'][part]
+        if len(minutes) == 0:
+            continue
+        x = minutes - minutes[0] + offset
+        suffix = f' - Route {ROUTES.index(view) + 1}' if view in ROUTES else (f' - Route {n}' if len(rows) > 1 else '')
+        for metric, label, color in spec.series:
+            if metric not in metrics:
+                continue
+            y = metrics[metric][part]
+            if metric in CUMULATIVE and view != 'voyage':
+                y = y - y[0] + carried.get(metric, 0.0)
+                carried[metric] = y[-1]
+            # In a combined view each route gets its own colour
+            lines.append(downsample(x, y, PLOT_POINTS, DOWNSAMPLE) + (label + suffix, color if len(rows) == 1 else None))
+        if n < len(rows):
+            offset = x[-1]
+            transition = offset
+    return lines, transition
+
+
+def figure_jobs(frame, out_dir, figures=FIGURES):
+    # FigureJobs for every view of every spec
+    metrics = figure_metrics(frame)
+    try:
+        routes = route_bounds(frame)
+    except (ValueError, KeyError):
+        # Fewer than two transit legs: only whole-voyage views make sense
+        routes = None
+
+    jobs = []
+    for name, spec in figures.items():
+        for view in spec.views:
+            if routes is None and view != 'voyage':
+                continue
+            lines, transition = view_lines(metrics, spec, view, routes)
+            if not lines:
+                continue
+            title = spec.title + {'route_1': ' - Route 1', 'route_2': ' - Route 2',
+                                  'combined': ' (Combined Routes)', 'voyage': ''}[view]
+            jobs.append(FigureJob(os.path.join(out_dir, f'{name}_{view}.png'), title, spec.ylabel, lines, transition))
+    return jobs
+
+
+def job_hash(job):
+    # Hash of everything that ends up in the picture
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((FIGURE_VERSION, FIGSIZE, DPI, job.title, job.ylabel, job.transition)).encode())
+    for x, y, label, color in job.lines:
+        digest.update(repr((label, color, len(x))).encode())
+        digest.update(np.ascontiguousarray(x, dtype=np.float64).tobytes())
+        digest.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+@profiled('render')
+def render(job):
+    # Draw one figure without pyplot, so no GUI backend or global figure state is involved
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=FIGSIZE)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    for x, y, label, color in job.lines:
+        axes.plot(x, y, label=label, color=color)
+    if job.transition is not None:
+        axes.axvline(x=job.transition, color='gray', linestyle='--', label='Transition Point')
+    axes.set_title(job.title)
+    axes.set_xlabel('Time (minutes from start)')
+    axes.set_ylabel(job.ylabel)
+    axes.legend()
+    axes.grid()
+    # Fixed margins instead of tight_layout, which lays out every label twice
+    figure.subplots_adjust(left=0.06, right=0.98, bottom=0.09, top=0.94)
+    tmp_path = job.path + '.tmp.png'
+    with stage('savefig'):
+        figure.savefig(tmp_path, dpi=DPI)
+    os.replace(tmp_path, job.path)
+    return job.path
+
+
+def _read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def render_jobs(jobs, workers=None, force=False):
+    # Render the jobs whose output is missing or whose inputs changed, in a process pool.
+    # Returns (rendered, unchanged) counts.
+    manifests = {}
+    todo = []
+    for job in jobs:
+        out_dir, file_name = os.path.split(job.path)
+        manifest = manifests.setdefault(out_dir, _read_manifest(out_dir))
+        digest = job_hash(job)
+        if not force and manifest.get(file_name) == digest and os.path.exists(job.path):
+            continue
+        todo.append((job, out_dir, file_name, digest))
+
+    for out_dir in {out_dir for _, out_dir, _, _ in todo}:
+        os.makedirs(out_dir, exist_ok=True)
+    if workers == 1 or len(todo) <= 1:
+        for job, _, _, _ in todo:
+            render(job)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render, [job for job, _, _, _ in todo]))
+
+    for _, out_dir, file_name, digest in todo:
+        manifests[out_dir][file_name] = digest
+    for out_dir in {out_dir for _, out_dir, _, _ in todo}:
+        _write_manifest(out_dir, manifests[out_dir])
+    return len(todo), len(jobs) - len(todo)
+
+
+def render_voyages(path, out_dir, step='1s', workers=None, force=False, figures=FIGURES, cache=False):
+    # The figure set of every voyage under path; several voyages get a subdirectory each.
+    # cache: keep the aligned tables next to the logs, off so rendering only writes figures
+    voyages = voyage_paths(path)
+    jobs = []
+    for voyage in voyages:
+        frame = load_aligned_data(voyage, step=step, sensors=BATCH_SENSORS, workers=1, cache=cache)
+        if len(frame) == 0:
+            continue
+        target = out_dir if len(voyages) == 1 else os.path.join(out_dir, voyage_name(voyage))
+        jobs += figure_jobs(frame, target, figures)
+    return render_jobs(jobs, workers, force)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the route and voyage figure set of Gunnerus logs')
+    parser.add_argument('path', help='voyage log file, or a directory of voyages')
+    parser.add_argument('--out', default='Bilder')
+    parser.add_argument('--step', default='1s', help='time grid the logs are aligned to')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help='redraw figures that are up to date')
+    parser.add_argument('--cache', action='store_true', help='cache the aligned tables next to the logs')
+    args = parser.parse_args()
+
+    rendered, unchanged = render_voyages(args.path, args.out, args.step, args.workers, args.force, cache=args.cache)
+    print(f'{rendered} figures rendered, {unchanged} up to date, in {args.out}')
+
+
+if __name__ == '__main__':
+    main()
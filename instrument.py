@@ -0,0 +1,272 @@
+import argparse
+import atexit
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+try:
+    import resource  # POSIX only
+except ImportError:
+    resource = None
+
+try:
+    import psutil  # optional, memory figures where resource is missing, e.g. Windows
+except ImportError:
+    psutil = None
+
+# Stage timing of the pipeline, off unless GUNNERUS_PROFILE names an output file:
+#   GUNNERUS_PROFILE=stages.jsonl  one JSON line per stage
+#   GUNNERUS_PROFILE=trace.json    Chrome trace, for chrome://tracing, Perfetto or speedscope
+#   GUNNERUS_PROFILE=1             stages.jsonl in the working directory
+# Worker processes inherit the variable and add their stages to the same file.
+PROFILE_ENV = 'GUNNERUS_PROFILE'
+DEFAULT_PROFILE = 'stages.jsonl'
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process so far, None where it cannot be read.
+    # ru_maxrss is in KiB on Linux, bytes on macOS; psutil gives the peak working set on Windows.
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 2**20
+    return None
+
+
+def rss_mb():
+    # Current resident set size, from /proc where there is one, else psutil or the peak
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2**20
+    except OSError:
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    return peak_rss_mb()
+
+
+class Profile:
+    # Where stage records go. The process that switches profiling on starts the
+    # file; worker processes append to it.
+
+    def __init__(self, path):
+        self.path = path
+        self.chrome = path.endswith('.json')
+        self.stack = []
+        if multiprocessing.parent_process() is None:
+            self._start()
+
+    def _start(self):
+        with open(self.path, 'w') as f:
+            if self.chrome:
+                # The array is opened with a metadata event so every stage can follow
+                # a comma, and closed when this process exits
+                f.write('[' + json.dumps({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+                                          'args': {'name': os.path.basename(sys.argv[0]) or 'python'}}))
+                atexit.register(self._close)
+
+    def _close(self):
+        with open(self.path, 'a') as f:
+            f.write('\n]\n')
+
+    def write(self, record):
+        if self.chrome:
+            args = {key: value for key, value in record.items()
+                    if key not in ('stage', 'start', 'wall_s', 'pid', 'parent')}
+            line = ',\n' + json.dumps({'name': record['stage'], 'cat': 'stage', 'ph': 'X',
+                                       'ts': record['start'] * 1e6, 'dur': record['wall_s'] * 1e6,
+                                       'pid': record['pid'], 'tid': record['pid'], 'args': args})
+        else:
+            line = json.dumps(record) + '\n'
+        # One short append per stage, so records of concurrent processes do not interleave
+        with open(self.path, 'a') as f:
+            f.write(line)
+
+
+def _from_env():
+    path = os.environ.get(PROFILE_ENV, '').strip()
+    if path.lower() in ('', '0', 'false', 'no', 'off'):
+        return None
+    if path.lower() in ('1', 'true', 'yes', 'on'):
+        path = DEFAULT_PROFILE
+    return Profile(path)
+
+
+_profile = _from_env()
+
+
+def enabled():
+    return _profile is not None
+
+
+def enable(path=DEFAULT_PROFILE):
+    # Switch profiling on from code, e.g. in a benchmark; workers started
+    # afterwards record too
+    global _profile
+    os.environ[PROFILE_ENV] = path
+    _profile = Profile(path)
+    return _profile
+
+
+def disable():
+    global _profile
+    os.environ.pop(PROFILE_ENV, None)
+    _profile = None
+
+
+class _Disabled:
+    # What stage() returns with profiling off: a do-nothing context manager
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_DISABLED = _Disabled()
+
+
+class Stage:
+    # Wall time, CPU time, rows and memory of one pipeline stage. Set rows inside
+    # the block when the count is only known there.
+
+    def __init__(self, profile, name, rows, args):
+        self.profile = profile
+        self.name = name
+        self.rows = rows
+        self.args = args
+        self.discard = False
+
+    def __enter__(self):
+        self.profile.stack.append(self.name)
+        self.rss = rss_mb()
+        self.start = time.time()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        rss = rss_mb()
+        self.profile.stack.pop()
+        if self.discard:
+            return False
+        record = {'stage': self.name, 'start': self.start, 'wall_s': wall, 'cpu_s': cpu,
+                  'rows': self.rows,
+                  'rows_per_s': self.rows / wall if self.rows is not None and wall > 0 else None,
+                  'rss_mb': rss, 'rss_delta_mb': None if rss is None or self.rss is None else rss - self.rss,
+                  'peak_rss_mb': peak_rss_mb(),
+                  'pid': os.getpid(),
+                  'parent': self.profile.stack[-1] if self.profile.stack else None}
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        record.update(self.args)
+        self.profile.write(record)
+        return False
+
+
+def stage(name, rows=None, **args):
+    # Context manager timing a block as one stage, e.g.
+    #   with stage('pivot', rows=len(log)):
+    # Extra keyword arguments are stored with the record. Free when profiling is off.
+    if _profile is None:
+        return _DISABLED
+    return Stage(_profile, name, rows, args)
+
+
+def profiled(name=None, rows=None):
+    # Decorator timing every call of a function as a stage; rows(result) gives the
+    # row count, e.g. @profiled('pivot', rows=len)
+    def decorate(function):
+        stage_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profile is None:
+                return function(*args, **kwargs)
+            with Stage(_profile, stage_name, None, {}) as timing:
+                result = function(*args, **kwargs)
+                if rows is not None:
+                    timing.rows = rows(result)
+            return result
+        return wrapper
+    return decorate
+
+
+def profiled_iter(iterable, name, rows=len):
+    # The items of an iterable, each fetch timed as a stage, e.g. the chunks of pd.read_csv
+    if _profile is None:
+        return iterable
+    return _timed_items(iter(iterable), name, rows)
+
+
+def _timed_items(iterator, name, rows):
+    while True:
+        with Stage(_profile, name, None, {}) as timing:
+            item = next(iterator, _DISABLED)
+            if item is _DISABLED:
+                timing.discard = True  # the fetch that found the end is not a stage
+            else:
+                timing.rows = rows(item)
+        if item is _DISABLED:
+            return
+        yield item
+
+
+def read_records(path):
+    # Stage records of a profile file, JSON lines or Chrome trace
+    with open(path) as f:
+        text = f.read()
+    if not path.endswith('.json'):
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    text = text.rstrip()
+    if not text.endswith(']'):
+        text += '\n]'  # the writing process is still running or did not exit cleanly
+    records = []
+    for event in json.loads(text):
+        if event.get('ph') == 'X':
+            record = {'stage': event['name'], 'start': event['ts'] / 1e6, 'wall_s': event['dur'] / 1e6,
+                      'pid': event['pid']}
+            record.update(event.get('args', {}))
+            records.append(record)
+    return records
+
+
+def summary(records):
+    # Totals per stage name: calls, wall and CPU seconds, rows, largest memory delta
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record['stage'], {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows': 0,
+                                                     'rss_delta_mb': 0.0})
+        total['calls'] += 1
+        total['wall_s'] += record['wall_s']
+        total['cpu_s'] += record.get('cpu_s') or 0.0
+        total['rows'] += record.get('rows') or 0
+        total['rss_delta_mb'] = max(total['rss_delta_mb'], record.get('rss_delta_mb') or 0.0)
+    return dict(sorted(totals.items(), key=lambda item: -item[1]['wall_s']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f'Summarize a stage profile written with {PROFILE_ENV} set')
+    parser.add_argument('path', nargs='?', default=os.environ.get(PROFILE_ENV) or DEFAULT_PROFILE)
+    args = parser.parse_args()
+
+    print(f"{'stage':24s} {'calls':>6s} {'wall s':>9s} {'cpu s':>9s} {'rows/s':>12s} {'max +MB':>8s}")
+    for name, total in summary(read_records(args.path)).items():
+        rate = f"{total['rows'] / total['wall_s']:12.0f}" if total['rows'] and total['wall_s'] > 0 else ''
+        print(f"{name:24s} {total['calls']:6d} {total['wall_s']:9.3f} {total['cpu_s']:9.3f} {rate:>12s} "
+              f"{total['rss_delta_mb']:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from align import to_ns
+from timestamps import column_ns
+
+# 'hold': each value holds until the next row (zero-order hold), as in a forward-filled table
+# 'trapezoid': values change linearly between rows
+INTEGRATION_METHODS = ('hold', 'trapezoid')
+
+
+def time_ns(time):
+    # int64 epoch ns from a timestamp column/index or an array that already holds ns
+    if isinstance(time, (pd.Series, pd.Index)) and not pd.api.types.is_integer_dtype(time.dtype):
+        return column_ns(time)
+    return np.asarray(time, dtype=np.int64)
+
+
+def gaps(time, max_gap):
+    # Mask of the intervals between consecutive rows that are longer than max_gap
+    return np.diff(time_ns(time)) > to_ns(max_gap)
+
+
+def increments(time, values, method='hold', max_gap=None, per='1h'):
+    # Integral of values over each interval between consecutive rows, (n - 1) x columns.
+    # values is 1-D or (time x column) and is a rate per `per`, e.g. kg/h -> kg.
+    # Intervals longer than max_gap are missing data and contribute nothing,
+    # as do intervals touching a NaN value.
+    if method not in INTEGRATION_METHODS:
+        raise ValueError(f"method must be one of {INTEGRATION_METHODS}, got {method!r}")
+    time = time_ns(time)
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) != len(time):
+        raise ValueError(f"{len(values)} values for {len(time)} timestamps")
+    if len(time) < 2:
+        return np.zeros((0,) + values.shape[1:])
+
+    dt = np.diff(time) / to_ns(per)
+    if max_gap is not None:
+        dt[dt > to_ns(max_gap) / to_ns(per)] = 0
+    if values.ndim > 1:
+        dt = dt[:, None]
+
+    if method == 'hold':
+        area = values[:-1] * dt
+    else:
+        area = np.add(values[:-1], values[1:])
+        area *= dt
+        area *= 0.5
+    return np.nan_to_num(area, copy=False)
+
+
+def cumulative(time, values, method='hold', max_gap=None, per='1h'):
+    # Running integral at every row, starting at 0 on the first row
+    area = increments(time, values, method, max_gap, per)
+    total = np.zeros((len(area) + 1,) + area.shape[1:])
+    np.cumsum(area, axis=0, out=total[1:])
+    return total
+
+
+def integrate(time, values, method='hold', max_gap=None, per='1h'):
+    # Integral over all rows, one number per column
+    return increments(time, values, method, max_gap, per).sum(axis=0)
+
+
+def row_totals(time, values, bounds, method='hold', max_gap=None, per='1h'):
+    # Integral over each (start, finish) row range, e.g. the routes from
+    # segments.route_bounds, from one running integral. finish is exclusive:
+    # a range covers the time from row start up to row finish.
+    total = cumulative(time, values, method, max_gap, per)
+    bounds = np.clip(np.asarray(bounds, dtype=np.int64), 0, len(total) - 1)
+    return total[bounds[:, 1]] - total[bounds[:, 0]]
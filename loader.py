@@ -0,0 +1,277 @@
+import glob
+import hashlib
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from align import ALIGN_METHODS, aligned_frame, bfill_columns, ffill_columns, to_ns
+from cache import cached_table
+from instrument import profiled, profiled_iter, stage
+from quality import QualityReport, hold_limits, quality_flags, screen, usable_log
+from registry import SensorRegistry, SensorSelection
+from sensorlog import SensorLog
+from timestamps import NAT, to_epoch_ns
+
+# Column layout of the Gunnerus MQTT log: timestamp;sensor;value;unit
+COLUMNS = ['timestamp', 'sensor', 'value', 'unit']
+
+# Number of log rows parsed at a time, bounds the memory used by the raw text.
+# The whole log is still held, encoded: about 18 bytes a reading (int64 time,
+# small-int sensor code, float64 value, uint8 quality flags), so the peak of a
+# build is that compact log plus the output table, not one chunk.
+CHUNK_SIZE = 500_000
+
+# Fill policies used by the analysis scripts
+FILL_METHODS = ('ffill', 'bfill', None)
+
+
+def read_log_chunks(file_path, chunksize=CHUNK_SIZE):
+    # Stream the long-format log in fixed-size pieces instead of one big frame.
+    # Sensor and unit are read as categoricals so each name is stored once per chunk.
+    return pd.read_csv(file_path, sep=';', header=None, names=COLUMNS,
+                       dtype={'timestamp': object, 'sensor': 'category', 'unit': 'category'},
+                       encoding='utf-8-sig', chunksize=chunksize)
+
+
+class TimestampReport:
+    # Running count of rows that were off the logger's fixed timestamp layout
+    def __init__(self):
+        self.rows = 0
+        self.nonstandard = 0
+        self.invalid = 0
+
+    def warn(self, file_path):
+        if self.nonstandard:
+            warnings.warn(f"{file_path}: {self.nonstandard} of {self.rows} rows had a non-standard "
+                          f"timestamp layout, {self.invalid} of them could not be parsed and were skipped")
+
+
+def encode_chunk(chunk, registry, report=None, value_dtype=np.float64, selection=None):
+    # Turn one parsed chunk into (time, code, value) arrays against the registry.
+    # Rows of sensors outside the selection are dropped before any further parsing.
+    categories = chunk['sensor'].cat.categories
+    local_code = chunk['sensor'].cat.codes.to_numpy()
+    if selection is not None and selection.patterns is not None:
+        # The extra False entry catches missing sensor names (code -1)
+        wanted = np.append(selection.mask(categories), False)
+        rows = np.flatnonzero(wanted[local_code])
+    else:
+        rows = np.flatnonzero(local_code >= 0)
+    local_code = local_code[rows]
+
+    with stage('parse_timestamps', rows=len(rows)):
+        epoch_ns, nonstandard, invalid = to_epoch_ns(chunk['timestamp'].to_numpy()[rows])
+    if report is not None:
+        report.rows += len(rows)
+        report.nonstandard += nonstandard
+        report.invalid += invalid
+    keep = epoch_ns != NAT
+
+    # Unit of each sensor in the chunk, taken from its first row
+    present, first_row = np.unique(local_code, return_index=True)
+    units = chunk['unit'].to_numpy()[rows[first_row]]
+    units = [None if pd.isna(unit) else str(unit) for unit in units]
+    to_global = np.zeros(len(categories), dtype=np.int32)
+    to_global[present] = registry.encode(list(categories[present]), units)
+
+    value = pd.to_numeric(chunk['value'].iloc[rows], errors='coerce').to_numpy(dtype=value_dtype)
+    return epoch_ns[keep], to_global[local_code[keep]], value[keep]
+
+
+def read_log(file_path, chunksize=CHUNK_SIZE, value_dtype=np.float64, sensors=None):
+    # Read the whole log into compact typed arrays, one chunk of raw text at a time.
+    # The arrays of every chunk are kept: the quality checks and the fill need each
+    # sensor's full history, so the pivot runs once on the complete log.
+    # sensors: names or glob patterns to keep, None keeps every sensor.
+    registry = SensorRegistry()
+    report = TimestampReport()
+    selection = SensorSelection(sensors)
+    with stage('read_log', file=os.fspath(file_path)) as timing:
+        pieces = []
+        for chunk in profiled_iter(read_log_chunks(file_path, chunksize), 'read_csv'):
+            with stage('encode', rows=len(chunk)):
+                pieces.append(encode_chunk(chunk, registry, report, value_dtype, selection))
+        report.warn(file_path)
+        log = SensorLog.concatenate(registry, pieces, value_dtype)
+        # Quality flags are always checked, so dropouts and bad readings never pass unnoticed
+        log.flags = quality_flags(log)
+        QualityReport().add(log, log.flags).warn(file_path)
+        timing.rows = len(log)
+    return log
+
+
+def expand_paths(path):
+    # A log file, a directory of *.csv logs, a glob pattern or a list of those,
+    # as a sorted list of files
+    if isinstance(path, (list, tuple)):
+        return sorted({file for item in path for file in expand_paths(item)})
+    path = os.fspath(path)
+    if os.path.isdir(path):
+        files = glob.glob(os.path.join(path, '*.csv'))
+    elif glob.has_magic(path):
+        files = glob.glob(path)
+    else:
+        return [path]
+    if not files:
+        raise FileNotFoundError(f"No log files found for {path!r}")
+    return sorted(files)
+
+
+def read_logs(path, chunksize=CHUNK_SIZE, value_dtype=np.float64, sensors=None, workers=None, quality=False):
+    # Read one or many log files into a single time-ordered SensorLog.
+    # Files are parsed in a process pool; duplicate readings at file boundaries
+    # resolve to the later file (see SensorLog.merge).
+    # quality: leave out the readings quality.DROP flags.
+    paths = expand_paths(path)
+    if len(paths) == 1:
+        log = read_log(paths[0], chunksize, value_dtype, sensors)
+    else:
+        read = partial(read_log, chunksize=chunksize, value_dtype=value_dtype, sensors=sensors)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            logs = list(pool.map(read, paths))
+        with stage('merge', rows=sum(len(log) for log in logs), files=len(paths)):
+            log = SensorLog.merge(logs, value_dtype)
+        # Gaps and stuck runs can span files; each file was already reported on
+        log.flags = quality_flags(log)
+    if quality:
+        with stage('screen', rows=len(log)):
+            log = screen(log)
+    return log
+
+
+def cache_location(path, paths):
+    # Single logs cache next to the file; several logs next to their directory,
+    # under a name derived from the file list
+    if len(paths) == 1:
+        return paths[0], ''
+    if isinstance(path, (str, os.PathLike)) and os.path.isdir(path):
+        directory = os.fspath(path)
+    else:
+        directory = os.path.dirname(os.path.abspath(paths[0]))
+    listing = '|'.join(os.path.abspath(p) for p in paths)
+    return os.path.join(directory, 'voyage'), '.' + hashlib.blake2b(listing.encode(), digest_size=6).hexdigest()
+
+
+@profiled('fill', rows=len)
+def fill_wide(wide, fill='ffill', staleness=None):
+    # staleness: hold a reading at most this long, so a sensor that stops
+    # reporting shows up as missing instead of a flat line; one limit, or an
+    # array of ns per column as from quality.hold_limits
+    if fill not in FILL_METHODS:
+        raise ValueError(f"fill must be one of {FILL_METHODS}, got {fill!r}")
+    if staleness is not None and fill is not None:
+        fill_columns = ffill_columns if fill == 'ffill' else bfill_columns
+        values = fill_columns(wide.to_numpy(), wide.index.as_unit('ns').asi8, staleness)
+        return pd.DataFrame(values, index=wide.index, columns=wide.columns)
+    if fill == 'ffill':
+        return wide.ffill()
+    if fill == 'bfill':
+        return wide.bfill()
+    return wide
+
+
+def usable_cells(frame):
+    # Boolean table of a filled/aligned usable_log: the timestamps, and True where
+    # the cell holds a reading that passed screening within its hold limit
+    usable = frame.iloc[:, 1:] == 1
+    usable.insert(0, 'timestamp', frame['timestamp'])
+    return usable
+
+
+def build_wide(path, chunksize=CHUNK_SIZE, sensors=None, workers=None, quality=False):
+    # The pivot runs on the compact arrays instead of a frame of Python strings
+    return read_logs(path, chunksize, sensors=sensors, workers=workers, quality=quality).pivot()
+
+
+def build_filled_data(path, fill='ffill', chunksize=CHUNK_SIZE, sensors=None, workers=None, quality=False,
+                      mask=False):
+    # Same table the scripts used to build with read_csv + pivot + fillna,
+    # with the timestamps as a regular column.
+    # mask=True also returns the usable cells of the table, see usable_cells.
+    log = read_logs(path, chunksize, sensors=sensors, workers=workers, quality=quality)
+    wide = log.pivot()
+    limits = hold_limits(wide.columns)
+    filled_data = fill_wide(wide, fill, limits if quality else None).reset_index()
+    if not mask:
+        return filled_data
+    usable = fill_wide(usable_log(log).pivot(), fill, limits).reset_index()
+    return filled_data, usable_cells(usable)
+
+
+def build_aligned_data(path, step='1s', how='last', chunksize=CHUNK_SIZE, sensors=None, workers=None,
+                       quality=False, mask=False):
+    log = read_logs(path, chunksize, sensors=sensors, workers=workers, quality=quality)
+    limits = hold_limits(log.registry.names)
+    aligned_data = aligned_frame(log, step, how, staleness=limits if quality else None)
+    if not mask:
+        return aligned_data
+    return aligned_data, usable_cells(aligned_frame(usable_log(log), step, how, staleness=limits))
+
+
+def cache_tag(fill, selection, quality=False):
+    tag = fill or 'nofill'
+    if quality:
+        tag += '.screened'
+    if selection.patterns is not None:
+        tag += '.' + hashlib.blake2b(selection.key().encode(), digest_size=6).hexdigest()
+    return tag
+
+
+def cached_tables(path, tag, build, mask=False):
+    # The table built by build(), through the cache; with mask, build() returns the
+    # table and its usable cells, and both are cached side by side
+    paths = expand_paths(path)
+    anchor, suffix = cache_location(path, paths)
+    tag += suffix
+    if not mask:
+        tables = [cached_table(paths, tag, build, anchor)]
+    else:
+        built = []
+
+        def build_table():
+            built.append(build())
+            return built[0][0]
+
+        tables = [cached_table(paths, tag, build_table, anchor),
+                  cached_table(paths, tag + '.mask', lambda: (built[0] if built else build())[1], anchor)]
+    for table in tables:
+        table.columns.name = 'sensor'
+    return tables[0] if not mask else tuple(tables)
+
+
+def load_filled_data(path, fill='ffill', chunksize=CHUNK_SIZE, cache=True, sensors=None, workers=None,
+                     quality=False, mask=False):
+    # path: a log file, a directory of logs or a glob such as 'logs/2024-09-*.csv'.
+    # Repeat runs read the pivoted table from a columnar cache next to the log.
+    # With sensors given, only those columns (and the timestamps they report on) are built.
+    # quality=True leaves out flagged readings and holds none longer than its
+    # quality.hold_limits. mask=True returns (table, usable cells), see usable_cells.
+    if fill not in FILL_METHODS:
+        raise ValueError(f"fill must be one of {FILL_METHODS}, got {fill!r}")
+
+    def build():
+        return build_filled_data(path, fill, chunksize, sensors, workers, quality, mask)
+
+    if not cache:
+        return build()
+    return cached_tables(path, cache_tag(fill, SensorSelection(sensors), quality), build, mask)
+
+
+def load_aligned_data(path, step='1s', how='last', chunksize=CHUNK_SIZE, cache=True, sensors=None,
+                      workers=None, quality=False, mask=False):
+    # All sensors on a uniform time grid instead of one row per distinct timestamp.
+    # how='last' gives the as-of value at each grid instant, how='mean' the interval mean.
+    # mask=True returns (table, usable cells) as for load_filled_data.
+    if how not in ALIGN_METHODS:
+        raise ValueError(f"how must be one of {ALIGN_METHODS}, got {how!r}")
+
+    def build():
+        return build_aligned_data(path, step, how, chunksize, sensors, workers, quality, mask)
+
+    if not cache:
+        return build()
+    return cached_tables(path, cache_tag(f'{how}{to_ns(step)}ns', SensorSelection(sensors), quality), build, mask)
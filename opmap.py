@@ -0,0 +1,232 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from loader import expand_paths, load_aligned_data
+from performance import ENGINES, FUEL, POWER, SPEED, engine_sensor, performance_metrics
+from powertrain import ENGINE_RATING
+
+# Default bins: engine load in % of rating and engine speed in rpm
+LOAD_EDGES = np.arange(0, 115, 5)
+RPM_EDGES = np.arange(0, 2050, 50)
+
+BOOST = 'boost_pressure'  # bar
+EXHAUST = ('exhaust_temperature1', 'exhaust_temperature2')  # celsius
+
+# Channels binned per engine
+MAP_CHANNELS = ('sfc', 'thermal_efficiency', 'fuel_flow', BOOST) + EXHAUST
+
+# Sensors engine_maps reads
+MAP_SENSORS = [engine_sensor(engine, quantity) for engine in ENGINES
+               for quantity in (POWER, SPEED, FUEL, BOOST) + EXHAUST]
+
+
+class OperatingMap:
+    # Count, sum, sum of squares, min and max of several channels per
+    # (x bin, y bin), e.g. mean SFC over load x rpm. Memory is fixed by the
+    # bins; readings are added in chunks of any size, and maps with the same
+    # bins and channels merge exactly, so files can be reduced in parallel.
+
+    def __init__(self, x_edges, y_edges, channels):
+        self.x_edges = np.asarray(x_edges, dtype=np.float64)
+        self.y_edges = np.asarray(y_edges, dtype=np.float64)
+        self.channels = list(channels)
+        shape = (len(self.channels), len(self.x_edges) - 1, len(self.y_edges) - 1)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.sum = np.zeros(shape)
+        self.sum2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+
+    @property
+    def shape(self):
+        # (x bins, y bins)
+        return self.count.shape[1:]
+
+    def _bins(self, edges, values):
+        # Bin index of every value, -1 outside the edges; the last bin includes its upper edge
+        index = np.searchsorted(edges, values, side='right') - 1
+        index[values == edges[-1]] = len(edges) - 2
+        index[(index >= len(edges) - 1) | np.isnan(values)] = -1
+        return index
+
+    def add(self, x, y, values):
+        # Add readings at operating points (x, y). values is (n x channel), or a
+        # dict channel -> array; channels not given count as missing.
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        if isinstance(values, dict):
+            values = np.column_stack([np.asarray(values[channel], dtype=np.float64).ravel()
+                                      if channel in values else np.full(len(x), np.nan)
+                                      for channel in self.channels])
+        values = np.asarray(values, dtype=np.float64).reshape(len(x), len(self.channels))
+
+        ix, iy = self._bins(self.x_edges, x), self._bins(self.y_edges, y)
+        inside = (ix >= 0) & (iy >= 0)
+        n_cells = self.shape[0] * self.shape[1]
+        cell = (ix * self.shape[1] + iy)[inside]
+        values = values[inside]
+
+        # Arrays are (channel, x, y), so each channel's cells are one flat view
+        count, total, total2 = self.count.reshape(len(self.channels), -1), \
+            self.sum.reshape(len(self.channels), -1), self.sum2.reshape(len(self.channels), -1)
+        low, high = self.min.reshape(len(self.channels), -1), self.max.reshape(len(self.channels), -1)
+        for c in range(len(self.channels)):
+            valid = ~np.isnan(values[:, c])
+            key, value = cell[valid], values[valid, c]
+            count[c] += np.bincount(key, minlength=n_cells)
+            total[c] += np.bincount(key, weights=value, minlength=n_cells)
+            total2[c] += np.bincount(key, weights=value * value, minlength=n_cells)
+            np.minimum.at(low[c], key, value)
+            np.maximum.at(high[c], key, value)
+        return self
+
+    def _check_compatible(self, other):
+        if (self.channels != other.channels or not np.array_equal(self.x_edges, other.x_edges)
+                or not np.array_equal(self.y_edges, other.y_edges)):
+            raise ValueError("Operating maps with different bins or channels cannot be merged")
+
+    def merge(self, other):
+        # Add the readings of another map with the same bins and channels
+        self._check_compatible(other)
+        self.count += other.count
+        self.sum += other.sum
+        self.sum2 += other.sum2
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+        return self
+
+    def channel(self, name):
+        return self.channels.index(name)
+
+    def counts(self, name):
+        return self.count[self.channel(name)]
+
+    def mean(self, name):
+        c = self.channel(name)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sum[c] / self.count[c]
+
+    def std(self, name):
+        c = self.channel(name)
+        mean = self.mean(name)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (self.sum2[c] - self.sum[c] * mean) / (self.count[c] - 1)
+        return np.sqrt(np.maximum(var, 0.0))
+
+    def minimum(self, name):
+        c = self.channel(name)
+        return np.where(self.count[c] > 0, self.min[c], np.nan)
+
+    def maximum(self, name):
+        c = self.channel(name)
+        return np.where(self.count[c] > 0, self.max[c], np.nan)
+
+    def state(self, prefix=''):
+        # Arrays for np.savez
+        return {prefix + 'x_edges': self.x_edges, prefix + 'y_edges': self.y_edges,
+                prefix + 'channels': np.array(self.channels), prefix + 'count': self.count,
+                prefix + 'sum': self.sum, prefix + 'sum2': self.sum2,
+                prefix + 'min': self.min, prefix + 'max': self.max}
+
+    @classmethod
+    def from_state(cls, state, prefix=''):
+        operating_map = cls(state[prefix + 'x_edges'], state[prefix + 'y_edges'],
+                            [str(name) for name in state[prefix + 'channels']])
+        for field in ('count', 'sum', 'sum2', 'min', 'max'):
+            setattr(operating_map, field, np.array(state[prefix + field]))
+        return operating_map
+
+
+def engine_maps(frame, engines=ENGINES, load_edges=LOAD_EDGES, rpm_edges=RPM_EDGES, rating=ENGINE_RATING):
+    # One load (% of rating) x rpm map per engine with a load column in a filled/aligned table
+    maps = {}
+    for engine in engines:
+        if engine_sensor(engine, POWER) not in frame:
+            continue
+
+        def column(quantity):
+            name = engine_sensor(engine, quantity)
+            return frame[name].to_numpy(dtype=np.float64) if name in frame else np.full(len(frame), np.nan)
+
+        power, rpm, fuel = column(POWER), column(SPEED), column(FUEL)
+        sfc, thermal_efficiency, _, _ = performance_metrics(power, fuel, rpm)
+        values = {'sfc': sfc, 'thermal_efficiency': thermal_efficiency, 'fuel_flow': fuel, BOOST: column(BOOST)}
+        values.update({quantity: column(quantity) for quantity in EXHAUST})
+        maps[engine] = OperatingMap(load_edges, rpm_edges, MAP_CHANNELS).add(power * (100 / rating), rpm, values)
+    return maps
+
+
+def merge_maps(maps, more):
+    # Merge a dict engine -> OperatingMap into another, in place
+    for engine, operating_map in more.items():
+        if engine in maps:
+            maps[engine].merge(operating_map)
+        else:
+            maps[engine] = operating_map
+    return maps
+
+
+def file_maps(file_path, step='1s', cache=False):
+    # Maps of one log file, read on a uniform grid so every second counts once.
+    # cache: keep the aligned table next to the log, off so a directory scan leaves no files behind
+    frame = load_aligned_data(file_path, step=step, sensors=MAP_SENSORS, cache=cache)
+    return engine_maps(frame)
+
+
+def build_maps(path, step='1s', workers=None, cache=False):
+    # Reduce every log file under path to maps, in parallel, and merge them.
+    # Only one file per worker is in memory at a time.
+    file_paths = expand_paths(path)
+    maps = {}
+    if workers == 1 or len(file_paths) == 1:
+        for file_path in file_paths:
+            merge_maps(maps, file_maps(file_path, step, cache))
+        return maps
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for more in pool.map(file_maps, file_paths, [step] * len(file_paths), [cache] * len(file_paths)):
+            merge_maps(maps, more)
+    return maps
+
+
+def save_maps(maps, file_path):
+    state = {}
+    for engine, operating_map in maps.items():
+        state.update(operating_map.state(f'{engine}/'))
+    np.savez_compressed(file_path, **state)
+
+
+def load_maps(file_path):
+    with np.load(file_path) as state:
+        engines = sorted({key.split('/')[0] for key in state.files})
+        return {engine: OperatingMap.from_state(state, f'{engine}/') for engine in engines}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build load x rpm operating maps from Gunnerus sensor logs')
+    parser.add_argument('path', nargs='+', help='log files, directories or glob patterns')
+    parser.add_argument('--out', default='operating_maps.npz')
+    parser.add_argument('--merge', action='store_true', help='add to the maps already in --out')
+    parser.add_argument('--step', default='1s')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache', action='store_true', help='cache the aligned tables next to the logs')
+    args = parser.parse_args()
+
+    maps = load_maps(args.out) if args.merge and os.path.exists(args.out) else {}
+    merge_maps(maps, build_maps(args.path, args.step, args.workers, args.cache))
+    save_maps(maps, args.out)
+
+    for engine, operating_map in maps.items():
+        print(f"{engine}: {operating_map.counts('sfc').sum()} samples with SFC")
+        sfc = operating_map.mean('sfc')
+        for i, j in zip(*np.nonzero(~np.isnan(sfc))):
+            print(f"  load {operating_map.x_edges[i]:5.1f}-{operating_map.x_edges[i + 1]:5.1f} % "
+                  f"rpm {operating_map.y_edges[j]:6.0f}-{operating_map.y_edges[j + 1]:6.0f}: "
+                  f"mean SFC {sfc[i, j] * 3600:6.1f} g/kWh")
+    print(f'Saved to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
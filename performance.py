@@ -0,0 +1,127 @@
+from collections import namedtuple
+
+import numpy as np
+
+from channels import unit_factor
+from instrument import profiled
+from powertrain import ENGINE_RATING, FUEL_DENSITY, Q_HS
+
+ENGINES = ('Engine1', 'Engine2', 'Engine3')
+POWER = 'engine_load'  # kW
+FUEL = 'fuel_consumption'  # l/h
+SPEED = 'engine_speed'  # rpm
+
+# Engine data from the project description
+BORE = 0.127  # m
+STROKE = 0.154  # m
+CYLINDERS = 8
+V_D = np.pi * (BORE / 2)**2 * STROKE  # Volume of one cylinder [m^3]
+
+# Below these the ratios are meaningless (idle or stopped engine) and are masked as NaN
+IDLE_POWER = 1.0  # kW
+STOPPED_RPM = 1.0  # rpm
+
+# Operating-point histogram over load in % of rating
+LOAD_BINS = np.arange(0, 110, 10)
+
+# Every metric is a (time x engine) array with NaN where the engine idles
+#   sfc                 specific fuel consumption [g/kJ = g/s per kW]
+#   thermal_efficiency  [%]
+#   torque              [Nm]
+#   bmep                brake mean effective pressure [Pa]
+#   best, worst         row of the highest and lowest thermal efficiency per engine among the rows
+#                       where torque and BMEP are defined too (engine turning), -1 if none
+#   load_counts         samples per LOAD_BINS interval per engine (engine x bin)
+#   load_efficiency     mean thermal efficiency per LOAD_BINS interval per engine
+EnginePerformance = namedtuple('EnginePerformance', [
+    'engines', 'sfc', 'thermal_efficiency', 'torque', 'bmep',
+    'best', 'worst', 'load_bins', 'load_counts', 'load_efficiency'])
+
+
+def engine_sensor(engine, quantity):
+    return f'gunnerus/RVG_mqtt/{engine}/{quantity}'
+
+
+# Sensors engine_performance reads, e.g. for load_aligned_data(..., sensors=PERFORMANCE_SENSORS)
+PERFORMANCE_SENSORS = [engine_sensor(engine, quantity) for engine in ENGINES for quantity in (POWER, FUEL, SPEED)]
+
+
+def engine_columns(frame, quantity, engines):
+    # (time x engine) array of one quantity, NaN for engines without the column
+    columns = np.full((len(frame), len(engines)), np.nan)
+    for i, engine in enumerate(engines):
+        name = engine_sensor(engine, quantity)
+        if name in frame:
+            columns[:, i] = frame[name].to_numpy(dtype=np.float64)
+    return columns
+
+
+def fuel_mass_flow(fuel_lph, density=FUEL_DENSITY):
+    # l/h -> g/s
+    return fuel_lph * (density * unit_factor('kg/h', 'g/s')[0])
+
+
+def performance_metrics(power, fuel_lph, rpm, density=FUEL_DENSITY, q_hs=Q_HS,
+                        idle_power=IDLE_POWER, stopped_rpm=STOPPED_RPM):
+    # SFC, thermal efficiency, torque and BMEP for arrays of any shape.
+    # Returns (sfc, thermal_efficiency, torque, bmep).
+    power = np.asarray(power, dtype=np.float64)
+    rpm = np.asarray(rpm, dtype=np.float64)
+    running = power > idle_power
+    turning = running & (rpm > stopped_rpm)
+    burning = running & (fuel_lph > 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sfc = np.where(burning, fuel_mass_flow(fuel_lph, density) / power, np.nan)
+        thermal_efficiency = 100 / (q_hs * unit_factor('g/kJ', 'kg/J')[0] * sfc)
+        revs = rpm / 60  # crank shaft rotational speed [rev/s]
+        torque = np.where(turning, power * 1000 / (2 * np.pi * revs), np.nan)
+        # Four-stroke: one power stroke every second revolution in each cylinder
+        bmep = np.where(turning, power * 1000 * 2 / (V_D * CYLINDERS * revs), np.nan)
+    return sfc, thermal_efficiency, torque, bmep
+
+
+def extremes(values):
+    # Row of the minimum and maximum of every column, ignoring NaN; -1 for all-NaN columns
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    empty = missing.all(axis=0)
+    worst = np.where(missing, np.inf, values).argmin(axis=0)
+    best = np.where(missing, -np.inf, values).argmax(axis=0)
+    return np.where(empty, -1, worst), np.where(empty, -1, best)
+
+
+def load_histogram(power, values, rating=ENGINE_RATING, bins=LOAD_BINS):
+    # Sample count and mean of values per load bin for every engine, one bincount
+    # over (engine, bin) keys. power and values are (time x engine).
+    load = np.asarray(power, dtype=np.float64) * (100 / rating)
+    n_bins = len(bins) - 1
+    n_engines = load.shape[1]
+    bin_of = np.searchsorted(bins, load, side='right') - 1
+    bin_of[load == bins[-1]] = n_bins - 1  # the last bin includes its upper edge
+    keep = (bin_of >= 0) & (bin_of < n_bins) & ~np.isnan(values)
+    key = (np.arange(n_engines) * n_bins + bin_of)[keep]
+    counts = np.bincount(key, minlength=n_engines * n_bins)
+    sums = np.bincount(key, weights=values[keep], minlength=n_engines * n_bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    return counts.reshape(n_engines, n_bins), means.reshape(n_engines, n_bins)
+
+
+@profiled('engine_performance')
+def engine_performance(frame, engines=ENGINES, density=FUEL_DENSITY, q_hs=Q_HS, rating=ENGINE_RATING,
+                       bins=LOAD_BINS, idle_power=IDLE_POWER, stopped_rpm=STOPPED_RPM):
+    # All metrics for every engine with a load column in a filled/aligned table,
+    # using the measured engine speed
+    engines = [engine for engine in engines if engine_sensor(engine, POWER) in frame]
+    power = engine_columns(frame, POWER, engines)
+    fuel_lph = engine_columns(frame, FUEL, engines)
+    rpm = engine_columns(frame, SPEED, engines)
+
+    sfc, thermal_efficiency, torque, bmep = performance_metrics(
+        power, fuel_lph, rpm, density, q_hs, idle_power, stopped_rpm)
+    # Extremes only where the engine is also turning, so torque and BMEP exist at them
+    worst, best = extremes(np.where(np.isnan(torque), np.nan, thermal_efficiency))
+    load_counts, load_efficiency = load_histogram(power, thermal_efficiency, rating, bins)
+    return EnginePerformance(engines, sfc, thermal_efficiency, torque, bmep,
+                             best, worst, np.asarray(bins), load_counts, load_efficiency)
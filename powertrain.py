@@ -0,0 +1,71 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Diesel generator set data from the project description
+ENGINE_RATING = 450  # kW
+EFFICIENCY_CURVE = (-0.0024, 0.402, 27.4382)  # η_e(x) = a x² + b x + c, x = load in % of rating
+
+# Efficiencies from the engine shaft to the propeller
+ETA_G = 0.96  # Generator
+ETA_VSD = 0.97  # Variable speed drive
+ETA_SW = 0.99  # Switchboard
+ETA_M = 0.97  # Motor
+ETA_CHAIN = ETA_G * ETA_VSD * ETA_SW * ETA_M
+
+# Fuel properties, the one place scripts and modules take them from
+LHV = 42 * 10**6  # Lower Heating Value in J/kg
+Q_HS = 45.4 * 10**6  # Heating value of diesel in the engine data, J/kg
+FUEL_DENSITY = 0.820  # Diesel density in kg/L
+CO2_FACTOR = 3.1  # kg CO2 per kg diesel
+
+THRUSTER_RATING = 500  # kW at 100 % LoadFeedback
+
+PowertrainResult = namedtuple('PowertrainResult', ['eta_e', 'combined_eta_e', 'eta_p', 'fuel_flow'])
+
+
+def _as_engine_columns(power):
+    # Accept a (time x engine) array or a list of per-engine series
+    if isinstance(power, (list, tuple)):
+        power = np.column_stack(power)
+    return np.asarray(power, dtype=np.float64)
+
+
+def _curve_coefficients(curve):
+    # (3,) for one curve shared by every engine, (engines, 3) for one curve per engine
+    curve = np.asarray(curve, dtype=np.float64)
+    return curve[..., 0], curve[..., 1], curve[..., 2]
+
+
+def engine_efficiency(power, rating=ENGINE_RATING, curve=EFFICIENCY_CURVE, out=None):
+    # η_e in % for engine power in kW. power may be 1-D or (time x engine);
+    # rating and curve may be given per engine.
+    # With x = k P and k = 100 / rating, η_e = P (a k² P + b k) + c, which is
+    # evaluated in a single output buffer without temporaries.
+    power = np.asarray(power, dtype=np.float64)
+    a, b, c = _curve_coefficients(curve)
+    k = 100 / np.asarray(rating, dtype=np.float64)
+    eta_e = np.multiply(power, a * k * k, out=out)
+    eta_e += b * k
+    eta_e *= power
+    eta_e += c
+    return eta_e
+
+
+def powertrain_model(power, rating=ENGINE_RATING, curve=EFFICIENCY_CURVE, eta_chain=ETA_CHAIN, lhv=LHV):
+    # Evaluate every engine at once from engine power in kW, (time x engine):
+    #   eta_e           η_e per engine [%]
+    #   combined_eta_e  power-weighted η_e of the engines running [%]
+    #   eta_p           total power efficiency η_p = combined η_e * chain [%]
+    #   fuel_flow       M_f = P * 3600 / (η_p / 100 * LHV) [kg/h]
+    power = _as_engine_columns(power)
+    eta_e = engine_efficiency(power, rating, curve)
+
+    total_power = power.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        combined_eta_e = np.einsum('ij,ij->i', eta_e, power)
+        combined_eta_e /= total_power
+        eta_p = combined_eta_e * eta_chain
+        fuel_flow = total_power * (1000 * 3600 * 100 / lhv)
+        fuel_flow /= eta_p
+    return PowertrainResult(eta_e, combined_eta_e, eta_p, fuel_flow)
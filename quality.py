@@ -0,0 +1,168 @@
+import warnings
+
+import numpy as np
+
+from align import to_ns
+from channels import quantity
+from sensorlog import SensorLog
+from instrument import profiled
+
+# Quality flags of a reading, one bit each in a uint8 per reading
+MISSING = 1        # value could not be parsed as a number
+DUPLICATE = 2      # the same sensor reported again on the same timestamp; the later reading wins
+OUT_OF_RANGE = 4   # outside the plausible range of the sensor's unit, e.g. LoadFeedback outside 0-100 %
+STUCK = 8          # repeats the previous value of a run that stayed constant for longer than the stuck limit
+STALE = 16         # followed by a gap in the sensor's readings longer than the staleness limit
+
+QUALITY_FLAGS = {'missing': MISSING, 'duplicate': DUPLICATE, 'out of range': OUT_OF_RANGE,
+                 'stuck': STUCK, 'stale': STALE}
+
+# Readings a screened log leaves out. Stale readings are kept; their hold is cut
+# at the staleness limit when the table is filled instead. Stuck readings are only
+# reported: a steady engine can hold a value for a long time.
+DROP = MISSING | DUPLICATE | OUT_OF_RANGE
+
+# Longest silence a reading is held across; the busiest sensors publish every
+# second and the slowest about every 20 s
+STALENESS = '60s'
+
+# Quantities the logger publishes on change only, so a long silence is a steady
+# value rather than a dropout. Their readings are held until the next one.
+ON_CHANGE = ('lube_oil_pressure', 'lube_oil_temperature', 'coolant_temperature', 'SpeedKnots', 'SpeedKmHr')
+
+# Shortest constant run treated as a frozen sensor. A constant 0 is a stopped
+# engine or thruster, not a stuck signal, and is never flagged.
+STUCK_LIMIT = '10min'
+
+# Plausible range of a reading by quantity (the last part of the sensor name);
+# a full sensor name overrides its quantity
+RANGE_LIMITS = {
+    'LoadFeedback': (0.0, 100.0),
+    'RPMFeedback': (-100.0, 100.0),  # signed, negative is reverse thrust
+    'engine_load': (0.0, np.inf),
+    'fuel_consumption': (0.0, np.inf),
+    'engine_speed': (0.0, np.inf),
+    'boost_pressure': (0.0, np.inf),
+    'lube_oil_pressure': (0.0, np.inf),
+    'exhaust_temperature1': (-273.15, np.inf),
+    'exhaust_temperature2': (-273.15, np.inf),
+    'coolant_temperature': (-273.15, np.inf),
+    'lube_oil_temperature': (-273.15, np.inf),
+    'SpeedKnots': (0.0, np.inf),
+    'SpeedKmHr': (0.0, np.inf),
+}
+
+
+def sensor_order(log):
+    # Row order grouping the readings by sensor, time ascending within a sensor and
+    # log order among equal timestamps. A stable sort on the small integer codes is
+    # enough for a time-ordered log; only out-of-order logs pay for the full lexsort.
+    order = np.argsort(log.code, kind='stable')
+    code, time = log.code[order], log.time[order]
+    if np.any((code[1:] == code[:-1]) & (time[1:] < time[:-1])):
+        order = np.lexsort((log.time, log.code))
+    return order
+
+
+def range_limits(registry, limits=RANGE_LIMITS):
+    # Lower and upper limit per sensor code, unbounded for sensors without limits
+    low = np.full(len(registry), -np.inf)
+    high = np.full(len(registry), np.inf)
+    for code, name in enumerate(registry.names):
+        limit = limits.get(name) or limits.get(quantity(name))
+        if limit is not None:
+            low[code], high[code] = limit
+    return low, high
+
+
+def hold_limits(sensors, staleness=STALENESS, on_change=ON_CHANGE):
+    # Longest hold per sensor name in ns, inf for the quantities published on change only
+    return np.array([np.inf if quantity(name) in on_change else to_ns(staleness) for name in sensors])
+
+
+@profiled('quality_flags', rows=len)
+def quality_flags(log, staleness=STALENESS, stuck=STUCK_LIMIT, limits=RANGE_LIMITS, on_change=ON_CHANGE):
+    # Quality flags of every reading of a SensorLog, as a uint8 array in log order.
+    # One pass of vectorized comparisons over the readings grouped by sensor.
+    n = len(log)
+    flags = np.zeros(n, dtype=np.uint8)
+    if n == 0:
+        return flags
+    order = sensor_order(log)
+    code, time = log.code[order], log.time[order]
+    value = log.value[order].astype(np.float64, copy=False)
+
+    missing = np.isnan(value)
+    flags[missing] |= MISSING
+
+    low, high = range_limits(log.registry, limits)
+    with np.errstate(invalid='ignore'):
+        flags[(value < low[code]) | (value > high[code])] |= OUT_OF_RANGE
+
+    # Comparisons of each reading with the next one of the same sensor
+    same = code[1:] == code[:-1]
+    step = time[1:] - time[:-1]
+    flags[:-1][same & (step == 0)] |= DUPLICATE
+    flags[:-1][same & (step > hold_limits(log.registry.names, staleness, on_change)[code[1:]])] |= STALE
+
+    # Runs of one sensor repeating the same value; NaN never equals itself so it ends a run
+    repeat = same & (value[1:] == value[:-1])
+    start = np.flatnonzero(np.r_[True, ~repeat])
+    end = np.r_[start[1:], n] - 1
+    frozen = (time[end] - time[start] >= to_ns(stuck)) & (value[start] != 0) & (end > start)
+    run = np.cumsum(np.r_[True, ~repeat]) - 1
+    flags[np.r_[False, repeat] & frozen[run]] |= STUCK
+
+    in_log_order = np.empty_like(flags)
+    in_log_order[order] = flags
+    return in_log_order
+
+
+def screen(log, drop=DROP):
+    # The readings of a flagged log that metrics should use
+    flags = log.flags if log.flags is not None else quality_flags(log)
+    return log.take((flags & drop) == 0)
+
+
+def usable_log(log, drop=DROP):
+    # The log with each value replaced by 1.0 where the reading passes screening and
+    # 0.0 where it is flagged. Missing values stay NaN, so pivoting, aligning and
+    # filling it picks the same readings as for the values themselves, and the
+    # filled result is 1 exactly where a table cell holds a usable reading.
+    flags = log.flags if log.flags is not None else quality_flags(log)
+    usable = np.where((flags & drop) == 0, 1.0, 0.0)
+    usable[np.isnan(log.value)] = np.nan
+    return SensorLog(log.registry, log.time, log.code, usable, flags)
+
+
+class QualityReport:
+    # Number of flagged readings per flag and sensor
+    def __init__(self):
+        self.rows = 0
+        self.counts = {}
+
+    def add(self, log, flags):
+        self.rows += len(flags)
+        for name, bit in QUALITY_FLAGS.items():
+            codes = log.code[(flags & bit) != 0]
+            if len(codes) == 0:
+                continue
+            per_sensor = self.counts.setdefault(name, {})
+            for code, count in zip(*np.unique(codes, return_counts=True)):
+                sensor = log.registry.names[code]
+                per_sensor[sensor] = per_sensor.get(sensor, 0) + int(count)
+        return self
+
+    def total(self, name):
+        return sum(self.counts.get(name, {}).values())
+
+    def warn(self, file_path):
+        if not self.counts:
+            return
+        lines = []
+        for name, per_sensor in self.counts.items():
+            worst = sorted(per_sensor.items(), key=lambda item: -item[1])[:3]
+            sensors = ', '.join(f"{sensor.split('/', 2)[-1]} {count}" for sensor, count in worst)
+            more = ', ...' if len(per_sensor) > len(worst) else ''
+            lines.append(f"{self.total(name)} {name} ({sensors}{more})")
+        warnings.warn(f"{file_path}: flagged readings out of {self.rows}: " + '; '.join(lines))
@@ -0,0 +1,84 @@
+from fnmatch import fnmatchcase
+
+import numpy as np
+
+
+class SensorRegistry:
+    # Maps sensor names such as 'gunnerus/RVG_mqtt/Engine1/engine_load' to small
+    # integer codes and keeps the unit each sensor reports in
+
+    def __init__(self):
+        self.names = []
+        self.units = []
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._codes
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def code(self, name, unit=None):
+        # Code of a sensor, registering it on first sight
+        code = self._codes.get(name)
+        if code is None:
+            code = len(self.names)
+            self._codes[name] = code
+            self.names.append(name)
+            self.units.append(unit)
+        elif self.units[code] is None and unit is not None:
+            self.units[code] = unit
+        return code
+
+    def lookup(self, name):
+        return self._codes[name]
+
+    def unit(self, name):
+        return self.units[self._codes[name]]
+
+    def code_dtype(self):
+        return np.int16 if len(self.names) < np.iinfo(np.int16).max else np.int32
+
+    def encode(self, names, units=None):
+        # Translate a batch of distinct names (e.g. the categories of a chunk)
+        # into a lookup table from local to global codes
+        if units is None:
+            units = [None] * len(names)
+        return np.array([self.code(name, unit) for name, unit in zip(names, units)], dtype=np.int32)
+
+    def sorted_codes(self):
+        # Codes in name order, the column order pandas' pivot produces
+        return np.array(sorted(range(len(self.names)), key=self.names.__getitem__), dtype=np.int64)
+
+
+class SensorSelection:
+    # Decides which sensors to keep from a list of names or glob patterns.
+    # A pattern matches the full name or any trailing part of it, so
+    # 'Engine*/fuel_consumption' selects 'gunnerus/RVG_mqtt/Engine1/fuel_consumption'.
+
+    def __init__(self, patterns=None):
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        self.patterns = None if patterns is None else list(patterns)
+        self._decisions = {}
+
+    def __call__(self, name):
+        if self.patterns is None:
+            return True
+        keep = self._decisions.get(name)
+        if keep is None:
+            keep = any(fnmatchcase(name, pattern) or fnmatchcase(name, '*/' + pattern)
+                       for pattern in self.patterns)
+            self._decisions[name] = keep
+        return keep
+
+    def mask(self, names):
+        # Boolean mask over a batch of distinct names
+        return np.array([self(name) for name in names], dtype=bool)
+
+    def key(self):
+        # Stable text identifying the selection, used in cache file names
+        return 'all' if self.patterns is None else '|'.join(sorted(self.patterns))
@@ -0,0 +1,243 @@
+import bisect
+import warnings
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from align import to_ns
+from integrate import time_ns
+
+# Statistics over a trailing time window (t - window, t], like pandas' time-based
+# rolling. Floats in `stats` are quantiles, e.g. ('mean', 'max', 0.95).
+ROLLING_STATS = ('count', 'sum', 'mean', 'var', 'std', 'min', 'max')
+
+# Upper bound on the elements gathered per block for rolling quantiles
+QUANTILE_BLOCK = 1 << 22
+
+
+def window_starts(time, window):
+    # First row inside the trailing window of every row
+    time = time_ns(time)
+    window_ns = to_ns(window)
+    if window_ns <= 0:
+        raise ValueError(f"window must be positive, got {window!r}")
+    return np.searchsorted(time, time - window_ns, side='right')
+
+
+def _prefix(x):
+    total = np.zeros((len(x) + 1,) + x.shape[1:])
+    np.cumsum(x, axis=0, out=total[1:])
+    return total
+
+
+def _range_reduce(x, lo, hi, reduce):
+    # reduce over rows [lo, hi) of every window from a sparse table: level k holds
+    # the reduction of 2**k rows, and any window is covered by two overlapping blocks
+    length = hi - lo
+    level_of = np.zeros(len(length), dtype=np.int64)
+    np.log2(length, out=level_of, casting='unsafe', where=length > 0)
+    out = np.empty((len(lo),) + x.shape[1:])
+    level, size = x, 1
+    for k in range(int(level_of.max(initial=0)) + 1):
+        if k:
+            level = reduce(level[:-size], level[size:])
+            size *= 2
+        rows = np.flatnonzero(level_of == k)
+        out[rows] = reduce(level[lo[rows]], level[hi[rows] - size])
+    return out
+
+
+def _range_quantile(x, lo, q):
+    # Quantile over rows [lo, i] of every row i, in blocks of a sliding window view
+    n = len(x)
+    width = int((np.arange(n) - lo).max(initial=0)) + 1
+    padded = np.concatenate([np.full((width - 1,) + x.shape[1:], np.nan), x])
+    view = np.lib.stride_tricks.sliding_window_view(padded, width, axis=0)
+    offset = np.arange(width)
+    out = np.empty(x.shape)
+    step = max(1, QUANTILE_BLOCK // (width * int(np.prod(x.shape[1:]))))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # windows without data
+        for first in range(0, n, step):
+            rows = np.arange(first, min(first + step, n))
+            # Row i of the view starts at row i - width + 1; blank what lies before lo
+            outside = offset < (lo[rows] - rows + width - 1)[:, None]
+            if x.ndim > 1:
+                outside = outside[:, None, :]
+            block = np.where(outside, np.nan, view[rows])
+            out[rows] = np.nanquantile(block, q, axis=-1)
+    return out
+
+
+def rolling_stats(time, values, window, stats=('mean',), min_periods=1):
+    # Trailing time-window statistics of 1-D or (time x column) values in one pass
+    # over shared prefix sums. NaN and infinite readings are skipped. Returns a
+    # dict stat -> array shaped like values; windows with fewer than min_periods
+    # readings are NaN.
+    for stat in stats:
+        if stat not in ROLLING_STATS and not isinstance(stat, float):
+            raise ValueError(f"stats must be from {ROLLING_STATS} or quantiles, got {stat!r}")
+    lo = window_starts(time, window)
+    x = np.asarray(values, dtype=np.float64)
+    if len(x) != len(lo):
+        raise ValueError(f"{len(x)} values for {len(lo)} timestamps")
+    hi = np.arange(1, len(x) + 1)
+    valid = np.isfinite(x)
+    count = _prefix(valid)
+    count = count[hi] - count[lo]
+
+    results = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if {'sum', 'mean', 'var', 'std'} & set(stats):
+            # Centre on the column mean so the squares do not lose precision
+            center = np.where(valid, x, 0.0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+            shifted = np.where(valid, x - center, 0.0)
+            s = _prefix(shifted)
+            s2 = _prefix(shifted * shifted)
+            window_sum = s[hi] - s[lo]
+            window_sum2 = s2[hi] - s2[lo]
+            mean = window_sum / count
+            var = (window_sum2 - window_sum * mean) / (count - 1)
+            results['sum'] = window_sum + count * center
+            results['mean'] = mean + center
+            results['var'] = np.maximum(var, 0.0)
+            results['std'] = np.sqrt(results['var'])
+        if 'min' in stats:
+            results['min'] = _range_reduce(np.where(valid, x, np.inf), lo, hi, np.minimum)
+        if 'max' in stats:
+            results['max'] = _range_reduce(np.where(valid, x, -np.inf), lo, hi, np.maximum)
+    for q in (stat for stat in stats if isinstance(stat, float)):
+        results[q] = _range_quantile(np.where(valid, x, np.nan), lo, q)
+    results['count'] = count.astype(np.float64)
+
+    too_few = count < max(min_periods, 1)
+    out = {}
+    for stat in stats:
+        result = results[stat]
+        if stat == 'var' or stat == 'std':
+            result = np.where(count < 2, np.nan, result)
+        out[stat] = result if stat == 'count' else np.where(too_few, np.nan, result)
+    return out
+
+
+def rolling(time, values, window, how='mean', min_periods=1):
+    # One rolling statistic; a Series or DataFrame comes back with its index and columns
+    result = rolling_stats(time, values, window, (how,), min_periods)[how]
+    if isinstance(values, pd.Series):
+        return pd.Series(result, index=values.index, name=values.name)
+    if isinstance(values, pd.DataFrame):
+        return pd.DataFrame(result, index=values.index, columns=values.columns)
+    return result
+
+
+class RollingWindow:
+    # Trailing time window over one live channel. Readings are pushed in time
+    # order; count, mean and std come from running sums, min and max from
+    # monotonic deques, all O(1) amortized per reading. Quantiles keep a
+    # sorted copy of the window and cost O(window) per reading, so they are
+    # only tracked when asked for.
+
+    def __init__(self, window, quantiles=False):
+        self.window_ns = to_ns(window)
+        self.readings = deque()
+        self._min = deque()
+        self._max = deque()
+        self._sorted = [] if quantiles else None
+        self._sum = 0.0
+        self._sum2 = 0.0
+        self.time = None
+
+    def advance(self, time):
+        # Move the window end to time (epoch ns), dropping readings that fall out of it
+        self.time = time
+        cutoff = time - self.window_ns
+        while self.readings and self.readings[0][0] <= cutoff:
+            _, value = self.readings.popleft()
+            self._sum -= value
+            self._sum2 -= value * value
+            if self._sorted is not None:
+                del self._sorted[bisect.bisect_left(self._sorted, value)]
+        for extremes in (self._min, self._max):
+            while extremes and extremes[0][0] <= cutoff:
+                extremes.popleft()
+        if not self.readings:
+            # Reset the running sums so rounding errors do not build up
+            self._sum = self._sum2 = 0.0
+
+    def push(self, time, value):
+        if self.time is not None and time < self.time:
+            raise ValueError(f"reading at {time} is older than the window end {self.time}")
+        self.advance(time)
+        if not np.isfinite(value):
+            return
+        self.readings.append((time, value))
+        self._sum += value
+        self._sum2 += value * value
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((time, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((time, value))
+        if self._sorted is not None:
+            bisect.insort(self._sorted, value)
+
+    @property
+    def count(self):
+        return len(self.readings)
+
+    @property
+    def mean(self):
+        return self._sum / self.count if self.count else float('nan')
+
+    @property
+    def var(self):
+        if self.count < 2:
+            return float('nan')
+        return max((self._sum2 - self._sum * self.mean) / (self.count - 1), 0.0)
+
+    @property
+    def std(self):
+        return self.var ** 0.5
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else float('nan')
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else float('nan')
+
+    def quantile(self, q):
+        # Linear interpolation between the closest ranks, as numpy.quantile
+        if self._sorted is None:
+            raise ValueError("quantiles are not tracked, create the window with quantiles=True")
+        if not self._sorted:
+            return float('nan')
+        position = q * (len(self._sorted) - 1)
+        below = int(position)
+        above = min(below + 1, len(self._sorted) - 1)
+        return self._sorted[below] + (self._sorted[above] - self._sorted[below]) * (position - below)
+
+
+class RollingChannels:
+    # A RollingWindow per channel of a live feed, created on first reading
+
+    def __init__(self, window, quantiles=False):
+        self.window = window
+        self.quantiles = quantiles
+        self.channels = {}
+
+    def update(self, time, channel, value):
+        window = self.channels.get(channel)
+        if window is None:
+            window = self.channels[channel] = RollingWindow(self.window, self.quantiles)
+        window.push(time, value)
+
+    def advance(self, time):
+        for window in self.channels.values():
+            window.advance(time)
+
+    def __getitem__(self, channel):
+        return self.channels[channel]
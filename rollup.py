@@ -0,0 +1,138 @@
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+from align import instant_ns, to_ns
+
+# Resolutions kept next to the raw readings, finest first
+ROLLUP_RESOLUTIONS = {'1s': to_ns('1s'), '1min': to_ns('1min'), '1h': to_ns('1h')}
+
+# One record per bucket [start, start + resolution) that holds readings. NaN
+# readings are not counted; last is the latest reading in the bucket.
+ROLLUP_DTYPE = np.dtype([('start', np.int64), ('count', np.int64), ('sum', np.float64),
+                         ('min', np.float64), ('max', np.float64), ('last', np.float64)])
+
+# Statistics of the readings with start <= time < end
+RollupStats = namedtuple('RollupStats', ['count', 'sum', 'mean', 'min', 'max', 'last'])
+
+
+def rollup(time, value, resolution_ns):
+    # Bucket records of one sensor's readings, time ascending
+    valid = ~np.isnan(value)
+    time, value = time[valid], value[valid]
+    if len(time) == 0:
+        return np.empty(0, ROLLUP_DTYPE)
+    bucket = time // resolution_ns
+    first = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    last = np.r_[first[1:], len(time)] - 1
+
+    records = np.empty(len(first), ROLLUP_DTYPE)
+    records['start'] = bucket[first] * resolution_ns
+    records['count'] = last - first + 1
+    records['sum'] = np.add.reduceat(value, first)
+    records['min'] = np.minimum.reduceat(value, first)
+    records['max'] = np.maximum.reduceat(value, first)
+    records['last'] = value[last]
+    return records
+
+
+def merge_record(earlier, later):
+    # One record from two of the same bucket, later holding the newer readings
+    merged = np.empty((), ROLLUP_DTYPE)
+    merged['start'] = earlier['start']
+    merged['count'] = earlier['count'] + later['count']
+    merged['sum'] = earlier['sum'] + later['sum']
+    merged['min'] = min(earlier['min'], later['min'])
+    merged['max'] = max(earlier['max'], later['max'])
+    merged['last'] = later['last']
+    return merged
+
+
+def combine(pieces):
+    # RollupStats of several record arrays and raw (time, value) pieces, in time order
+    count, total, low, high, last = 0, 0.0, np.inf, -np.inf, np.nan
+    for records in pieces:
+        if len(records) == 0:
+            continue
+        count += int(records['count'].sum())
+        total += float(records['sum'].sum())
+        low = min(low, float(records['min'].min()))
+        high = max(high, float(records['max'].max()))
+        last = float(records['last'][-1])
+    if count == 0:
+        return RollupStats(0, 0.0, np.nan, np.nan, np.nan, np.nan)
+    return RollupStats(count, total, total / count, low, high, last)
+
+
+def query_plan(start, end, resolutions=ROLLUP_RESOLUTIONS):
+    # Split [start, end) into pieces answered exactly by the coarsest resolution that
+    # fits them: the middle from the coarsest whole buckets, the edges from finer
+    # ones, and what is left below the finest resolution from the raw readings.
+    # Returns (label, start, end) pieces in time order, label None for raw.
+    levels = sorted(resolutions.items(), key=lambda item: item[1], reverse=True)
+    before, after = [], []
+    lo = hi = None
+    for label, resolution in levels:
+        a = -(-start // resolution) * resolution
+        b = end // resolution * resolution
+        if a >= b:
+            continue
+        if lo is None:
+            lo, hi = a, b
+            middle = (label, a, b)
+            continue
+        if a < lo:
+            before.append((label, a, lo))
+        if hi < b:
+            after.append((label, hi, b))
+        lo, hi = min(lo, a), max(hi, b)
+    if lo is None:
+        return [(None, start, end)] if start < end else []
+    plan = [(None, start, lo)] if start < lo else []
+    plan += before[::-1] + [middle] + after
+    if hi < end:
+        plan.append((None, hi, end))
+    return plan
+
+
+def rollup_stats(archive, name, start=None, end=None):
+    # RollupStats of one archived sensor over [start, end), mostly from rollups
+    entry = archive.sensors[name]
+    start = entry['first'] if start is None else instant_ns(start)
+    end = entry['last'] + 1 if end is None else instant_ns(end)
+    available = {label: ROLLUP_RESOLUTIONS[label] for label in entry.get('rollups', {})
+                 if label in ROLLUP_RESOLUTIONS}
+
+    pieces = []
+    for label, lo, hi in query_plan(start, end, available):
+        if label is None:
+            time, value = archive.series(name)
+            i, j = np.searchsorted(time, [lo, hi], side='left')
+            pieces.append(rollup(np.asarray(time[i:j]), np.asarray(value[i:j]), max(hi - lo, 1)))
+        else:
+            records = archive.rollups(name, label)
+            i, j = np.searchsorted(records['start'], [lo, hi], side='left')
+            pieces.append(records[i:j])
+    return combine(pieces)
+
+
+def main():
+    from archive import SensorArchive
+
+    parser = argparse.ArgumentParser(description='Statistics of archived sensors from the rollups')
+    parser.add_argument('archive_dir')
+    parser.add_argument('sensors', nargs='*', help='sensor names, default all')
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    args = parser.parse_args()
+
+    archive = SensorArchive(args.archive_dir)
+    for name in args.sensors or archive.names:
+        stats = rollup_stats(archive, name, args.start, args.end)
+        print(f'{name}: count {stats.count}, mean {stats.mean:.4g}, min {stats.min:.4g}, '
+              f'max {stats.max:.4g}, last {stats.last:.4g} {archive.unit(name)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from timestamps import column_ns
+
+# Signals the segmentation looks at
+THRUSTER_LOAD = ('gunnerus/RVG_mqtt/hcx_port_mp/LoadFeedback', 'gunnerus/RVG_mqtt/hcx_stbd_mp/LoadFeedback')
+THRUSTER_RPM = ('gunnerus/RVG_mqtt/hcx_port_mp/RPMFeedback', 'gunnerus/RVG_mqtt/hcx_stbd_mp/RPMFeedback')
+SPEED = 'gunnerus/RVG_mqtt/SeapathGPSVtg/SpeedKnots'
+SEGMENT_SENSORS = list(THRUSTER_LOAD + THRUSTER_RPM) + [SPEED]
+
+# Operating modes
+HARBOUR = 'harbour'
+STATION = 'station'  # station keeping, thrusters working while the vessel holds position
+TRANSIT = 'transit'
+MODES = (HARBOUR, STATION, TRANSIT)
+
+# Thresholds
+TRANSIT_SPEED = 3.0  # knots
+TRANSIT_LOAD = 20.0  # % thruster load, used when no speed signal is logged
+ACTIVE_LOAD = 3.0  # % thruster load
+ACTIVE_RPM = 5.0  # % thruster rpm
+MIN_DURATION = '60s'  # shorter runs are absorbed by the mode before them
+
+Segment = namedtuple('Segment', ['mode', 'start', 'end'])
+
+
+def _column(frame, names):
+    # Mean magnitude over the thrusters that are logged
+    present = [name for name in names if name in frame]
+    if not present:
+        return None
+    return np.nan_to_num(np.abs(frame[present].to_numpy(dtype=np.float64))).mean(axis=1)
+
+
+def _majority(time, mode, window_ns):
+    # Most common mode within +-window/2 of every row, from running counts per mode
+    lo = np.searchsorted(time, time - window_ns // 2, side='left')
+    hi = np.searchsorted(time, time + window_ns // 2, side='right')
+    votes = np.empty((len(mode), len(MODES)), dtype=np.int64)
+    for code in range(len(MODES)):
+        count = np.concatenate([[0], np.cumsum(mode == code)])
+        votes[:, code] = count[hi] - count[lo]
+    return votes.argmax(axis=1).astype(np.int8)
+
+
+def classify(frame, transit_speed=TRANSIT_SPEED, transit_load=TRANSIT_LOAD,
+             active_load=ACTIVE_LOAD, active_rpm=ACTIVE_RPM):
+    # Mode code (index into MODES) for every row of a filled/aligned table
+    load = _column(frame, THRUSTER_LOAD)
+    rpm = _column(frame, THRUSTER_RPM)
+    if load is None and rpm is None:
+        raise KeyError(f"Segmentation needs at least one of {SEGMENT_SENSORS[:-1]}")
+    n = len(frame)
+    load = np.zeros(n) if load is None else load
+    rpm = np.zeros(n) if rpm is None else rpm
+
+    active = (load >= active_load) | (rpm >= active_rpm)
+    if SPEED in frame and frame[SPEED].notna().any():
+        moving = np.nan_to_num(frame[SPEED].to_numpy(dtype=np.float64)) >= transit_speed
+    else:
+        moving = load >= transit_load
+
+    mode = np.full(n, MODES.index(HARBOUR), dtype=np.int8)
+    mode[active] = MODES.index(STATION)
+    mode[moving] = MODES.index(TRANSIT)
+    return mode
+
+
+def segment(frame, min_duration=MIN_DURATION, **thresholds):
+    # Split a table with a 'timestamp' column into harbour, station keeping and
+    # transit periods. Returns Segments with start/end timestamps, end exclusive
+    # (the start of the next segment, or just after the last row).
+    if len(frame) == 0:
+        return []
+    time = column_ns(frame['timestamp'])
+    min_ns = pd.Timedelta(min_duration).value
+    mode = _majority(time, classify(frame, **thresholds), min_ns)
+
+    # Runs of equal mode, as [first row, mode]
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(mode)) + 1])
+    ends = np.concatenate([starts[1:], [len(mode)]])
+    end_time = np.append(time[1:], time[-1] + 1)
+
+    runs = []
+    for first, last in zip(starts, ends):
+        kind = mode[first]
+        short = end_time[last - 1] - time[first] < min_ns
+        if runs and (short or runs[-1][1] == kind):
+            # Absorb short blips (and rejoin runs split by one) into the run before
+            continue
+        runs.append([first, kind])
+
+    segments = []
+    for i, (first, kind) in enumerate(runs):
+        last = runs[i + 1][0] if i + 1 < len(runs) else len(mode)
+        segments.append(Segment(MODES[kind], pd.Timestamp(time[first], tz='UTC'),
+                                pd.Timestamp(end_time[last - 1], tz='UTC')))
+    return segments
+
+
+def transit_legs(frame, n_routes=2, min_duration=MIN_DURATION, **thresholds):
+    # The first n_routes transit Segments, the voyage's routes
+    legs = [s for s in segment(frame, min_duration, **thresholds) if s.mode == TRANSIT]
+    if len(legs) < n_routes:
+        raise ValueError(f"Found {len(legs)} transit legs, expected at least {n_routes}")
+    return legs[:n_routes]
+
+
+def route_bounds(frame, n_routes=2, min_duration=MIN_DURATION, **thresholds):
+    # Row index (start, finish) of the first n_routes transit legs, for slicing the
+    # same table as the scripts do with route_1_start:route_1_finish
+    return [segment_rows(frame, leg) for leg in transit_legs(frame, n_routes, min_duration, **thresholds)]
+
+
+def segment_rows(frame, seg):
+    # Row slice bounds of a time segment in any table with a 'timestamp' column
+    time = column_ns(frame['timestamp'])
+    start = np.searchsorted(time, seg.start.value, side='left')
+    finish = np.searchsorted(time, seg.end.value, side='left')
+    return int(start), int(finish)
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from instrument import profiled
+from registry import SensorRegistry
+
+
+class SensorLog:
+    # Long-format log stored as compact typed arrays:
+    # time (int64 epoch ns), code (sensor code in the registry) and value,
+    # plus the quality flags of every reading once checked (see quality.py)
+
+    def __init__(self, registry, time, code, value, flags=None):
+        self.registry = registry
+        self.time = time
+        self.code = code
+        self.value = value
+        self.flags = flags
+
+    @classmethod
+    def empty(cls, value_dtype=np.float64):
+        return cls(SensorRegistry(), np.empty(0, np.int64), np.empty(0, np.int16),
+                   np.empty(0, value_dtype))
+
+    @classmethod
+    def concatenate(cls, registry, pieces, value_dtype=np.float64):
+        # pieces: (time, code, value) array triples, in log order
+        if not pieces:
+            log = cls.empty(value_dtype)
+            log.registry = registry
+            return log
+        time = np.concatenate([piece[0] for piece in pieces])
+        code = np.concatenate([piece[1] for piece in pieces]).astype(registry.code_dtype())
+        value = np.concatenate([piece[2] for piece in pieces]).astype(value_dtype, copy=False)
+        return cls(registry, time, code, value)
+
+    @classmethod
+    def merge(cls, logs, value_dtype=np.float64):
+        # Merge logs (e.g. one per file, in file order) into one time-ordered log.
+        # Readings of the same sensor on the same timestamp collapse to one, and the
+        # one from the later log (later row within a log) wins, so overlapping files
+        # merge the same way every time.
+        registry = SensorRegistry()
+        pieces = []
+        for log in logs:
+            to_global = registry.encode(log.registry.names, log.registry.units)
+            pieces.append((log.time, to_global[log.code], log.value))
+        merged = cls.concatenate(registry, pieces, value_dtype)
+        if len(merged) == 0:
+            return merged
+
+        rank = np.repeat(np.arange(len(pieces)), [len(piece[0]) for piece in pieces])
+        order = np.lexsort((rank, merged.code, merged.time))
+        time, code = merged.time[order], merged.code[order]
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = (time[1:] != time[:-1]) | (code[1:] != code[:-1])
+        return merged.take(order[last])
+
+    def __len__(self):
+        return len(self.time)
+
+    def nbytes(self):
+        return self.time.nbytes + self.code.nbytes + self.value.nbytes
+
+    def sensor(self, name):
+        # Time and value arrays of a single sensor
+        mask = self.code == self.registry.lookup(name)
+        return self.time[mask], self.value[mask]
+
+    def take(self, mask):
+        flags = None if self.flags is None else self.flags[mask]
+        return SensorLog(self.registry, self.time[mask], self.code[mask], self.value[mask], flags)
+
+    @profiled('pivot', rows=len)
+    def pivot(self):
+        # Wide table with one row per distinct timestamp and one column per sensor,
+        # like data.pivot(index='timestamp', columns='sensor', values='value')
+        n_sensors = len(self.registry)
+        times, row = np.unique(self.time, return_inverse=True)
+
+        # The last reading wins if a sensor reports twice on the same timestamp
+        key = row.astype(np.int64) * n_sensors + self.code
+        _, first_from_end = np.unique(key[::-1], return_index=True)
+        last = len(key) - 1 - first_from_end
+
+        # Columns are laid out in name order, as pandas' pivot does
+        columns = self.registry.sorted_codes()
+        position = np.empty(n_sensors, dtype=np.int64)
+        position[columns] = np.arange(n_sensors)
+
+        wide = np.full((len(times), n_sensors), np.nan, dtype=self.value.dtype)
+        wide[row[last], position[self.code[last]]] = self.value[last]
+
+        index = pd.DatetimeIndex(pd.to_datetime(times, utc=True), name='timestamp')
+        names = pd.Index([self.registry.names[c] for c in columns], name='sensor')
+        return pd.DataFrame(wide, index=index, columns=names)
@@ -0,0 +1,166 @@
+import argparse
+import socket
+import sys
+import time as wallclock
+
+from powertrain import CO2_FACTOR, FUEL_DENSITY, LHV, THRUSTER_RATING
+from timestamps import NAT, parse_timestamp
+
+FUEL_SUFFIX = '/fuel_consumption'
+THRUSTER_SUFFIX = '/LoadFeedback'
+
+
+def parse_record(line):
+    # 'timestamp;sensor;value;unit' -> (epoch ns, sensor, value, unit), or None if malformed
+    parts = line.strip().lstrip('\ufeff').split(';')
+    if len(parts) < 3:
+        return None
+    epoch_ns = parse_timestamp(parts[0])
+    try:
+        value = float(parts[2])
+    except ValueError:
+        return None
+    # A NaN would poison the running sums for good
+    if epoch_ns == NAT or value != value:
+        return None
+    return epoch_ns, parts[1], value, parts[3] if len(parts) > 3 else None
+
+
+class LiveMetrics:
+    # Last value per sensor plus running fuel and power figures, updated in O(1)
+    # per record. Cumulative fuel holds the fuel flow constant between records,
+    # the same way the forward-filled batch table does.
+
+    def __init__(self, fuel_density=FUEL_DENSITY, thruster_rating=THRUSTER_RATING, lhv=LHV):
+        self.fuel_density = fuel_density
+        self.thruster_rating = thruster_rating
+        self.lhv = lhv
+        self.last = {}
+        self.time = None
+        self.records = 0
+        self.late = 0       # records older than their sensor's last one, ignored
+        self.malformed = 0  # lines that could not be parsed
+        self.fuel_flow_lph = 0.0
+        self.propulsion_load = 0.0
+        self.total_fuel = 0.0
+
+    @property
+    def fuel_flow_kgph(self):
+        return self.fuel_flow_lph * self.fuel_density
+
+    @property
+    def propulsion_power(self):
+        # kW, from the summed thruster LoadFeedback in %
+        return self.thruster_rating / 100 * self.propulsion_load
+
+    @property
+    def efficiency(self):
+        # Total energy efficiency in %, as in Task_02_2_iv.py
+        if self.fuel_flow_kgph <= 0:
+            return float('nan')
+        return self.propulsion_power * 10**3 * 3600 / (self.fuel_flow_kgph * self.lhv) * 100
+
+    @property
+    def co2(self):
+        return self.total_fuel * CO2_FACTOR
+
+    def update(self, epoch_ns, sensor, value):
+        # Apply one record; returns False for a late record, which is ignored
+        last_ns, previous = self.last.get(sensor, (None, 0.0))
+        if last_ns is not None and epoch_ns < last_ns:
+            # Older than what this sensor already reported: newer state wins
+            self.late += 1
+            return False
+
+        if self.time is None:
+            self.time = epoch_ns
+        elif epoch_ns >= self.time:
+            self.total_fuel += self.fuel_flow_kgph * (epoch_ns - self.time) / 3.6e12
+            self.time = epoch_ns
+        # A record behind the clock but new for its sensor updates the value without
+        # integrating backwards
+
+        self.last[sensor] = (epoch_ns, value)
+        if sensor.endswith(FUEL_SUFFIX):
+            self.fuel_flow_lph += value - previous
+        elif sensor.endswith(THRUSTER_SUFFIX):
+            self.propulsion_load += value - previous
+        self.records += 1
+        return True
+
+    def feed(self, lines):
+        # Consume text records, yielding after every record that was used
+        for line in lines:
+            record = parse_record(line)
+            if record is None:
+                self.malformed += 1
+                continue
+            if self.update(*record[:3]):
+                yield record
+
+    def summary(self):
+        return {'time': self.time, 'records': self.records,
+                'fuel_flow_kgph': self.fuel_flow_kgph, 'total_fuel_kg': self.total_fuel,
+                'co2_kg': self.co2, 'propulsion_power_kw': self.propulsion_power,
+                'efficiency_pct': self.efficiency}
+
+
+def socket_lines(host, port):
+    # Records from a TCP feed that writes one record per line
+    connection = socket.create_connection((host, port))
+    with connection, connection.makefile('r', encoding='utf-8') as lines:
+        yield from lines
+
+
+def replay(file_path, speed=None):
+    # Stand-in for the broker: play a recorded log back, optionally in (scaled) real time
+    start_log = start_wall = None
+    with open(file_path, encoding='utf-8-sig') as lines:
+        for line in lines:
+            if speed:
+                epoch_ns = parse_timestamp(line.split(';', 1)[0])
+                if epoch_ns != NAT:
+                    if start_log is None:
+                        start_log, start_wall = epoch_ns, wallclock.monotonic()
+                    delay = (epoch_ns - start_log) / 1e9 / speed - (wallclock.monotonic() - start_wall)
+                    if delay > 0:
+                        wallclock.sleep(delay)
+            yield line
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Live fuel and power figures from a Gunnerus sensor feed')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--connect', metavar='HOST:PORT', help='read records from a TCP socket')
+    source.add_argument('--replay', metavar='FILE', help='play back a recorded log')
+    parser.add_argument('--speed', type=float, default=None, help='replay speed factor, default as fast as possible')
+    parser.add_argument('--every', type=float, default=10, help='seconds of log time between printouts')
+    args = parser.parse_args()
+
+    if args.connect:
+        host, port = args.connect.rsplit(':', 1)
+        lines = socket_lines(host, int(port))
+    elif args.replay:
+        lines = replay(args.replay, args.speed)
+    else:
+        lines = sys.stdin
+
+    metrics = LiveMetrics()
+    every_ns = int(args.every * 1e9)
+    next_print = None
+    for epoch_ns, _, _, _ in metrics.feed(lines):
+        if next_print is None:
+            next_print = epoch_ns + every_ns
+        if epoch_ns >= next_print:
+            next_print = epoch_ns + every_ns
+            print(f"{metrics.records:>10} records | fuel {metrics.fuel_flow_kgph:7.2f} kg/h "
+                  f"| total {metrics.total_fuel:9.3f} kg | propulsion {metrics.propulsion_power:7.1f} kW "
+                  f"| efficiency {metrics.efficiency:6.2f} %", flush=True)
+
+    summary = metrics.summary()
+    print(f"Total fuel consumption: {summary['total_fuel_kg']:.3f} kg, CO2: {summary['co2_kg']:.3f} kg "
+          f"({summary['records']} records, {metrics.late} late, {metrics.malformed} malformed)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,57 +1,48 @@
-import pandas as pd
 import matplotlib.pyplot as plt
+from channels import ChannelTable
+from downsample import downsample
+from loader import load_filled_data
+from powertrain import LHV, powertrain_model
 
 # Load the CSV file
 file_path = '/Users/frithoftangen/Library/CloudStorage/OneDrive-NTNU/PSM/Prosjekt/Gunnerus/data.csv'
-data = pd.read_csv(file_path, sep=';', header=None, names=['timestamp', 'sensor', 'value', 'unit'])
 
-# Convert the timestamp to datetime
-data['timestamp'] = pd.to_datetime(data['timestamp'])
+# Sensors used below
+sensors = ['gunnerus/RVG_mqtt/Engine1/engine_load',
+           'gunnerus/RVG_mqtt/Engine1/fuel_consumption',
+           'gunnerus/RVG_mqtt/Engine3/engine_load',
+           'gunnerus/RVG_mqtt/Engine3/fuel_consumption',
+           'gunnerus/RVG_mqtt/hcx_port_mp/LoadFeedback',
+           'gunnerus/RVG_mqtt/hcx_stbd_mp/LoadFeedback']
 
-# Pivot the DataFrame to get sensors as columns
-pivoted_data = data.pivot(index='timestamp', columns='sensor', values='value')
+# Load the log as a forward-filled table with sensors as columns
+filled_data = load_filled_data(file_path, fill='ffill', sensors=sensors)
 
-# Fill missing values using the forward fill method
-filled_data = pivoted_data.fillna(method='ffill')
-filled_data.reset_index(inplace=True)
+# Sensor values with their units, converted once on first use
+channels = ChannelTable(filled_data)
 
 # Extract power profiles for Engine 1 and Engine 3
 engine1_power = filled_data['gunnerus/RVG_mqtt/Engine1/engine_load'].values
 engine3_power = filled_data['gunnerus/RVG_mqtt/Engine3/engine_load'].values
 
-# Normalize power to calculate x(t) for each engine
-engine1_x = 100 * (engine1_power / 450)
-engine3_x = 100 * (engine3_power / 450)
-
-# Calculate η_e for each engine
-engine1_eta_e = -0.0024 * engine1_x**2 + 0.402 * engine1_x + 27.4382
-engine3_eta_e = -0.0024 * engine3_x**2 + 0.402 * engine3_x + 27.4382
-
-# Calculate combined efficiency η_e as weighted average
-total_power = engine1_power + engine3_power
-combined_eta_e = (engine1_eta_e * engine1_power + engine3_eta_e * engine3_power) / total_power
-
-# Calculate total power efficiency η_p
-eta_g = 0.96
-eta_VSD = 0.97
-eta_SW = 0.99
-eta_p = combined_eta_e * eta_g * eta_VSD * eta_SW * 0.97
+# Evaluate the powertrain model (η_e, combined η_e and η_p) for Engine 1 and Engine 3
+powertrain = powertrain_model([engine1_power, engine3_power])
+eta_p = powertrain.eta_p
 
 # Extract vectors for port and starboard load feedback
-port_load_feedback = (500 / 100) * filled_data['gunnerus/RVG_mqtt/hcx_port_mp/LoadFeedback'].values
-stbd_load_feedback = (500 / 100) * filled_data['gunnerus/RVG_mqtt/hcx_stbd_mp/LoadFeedback'].values
+port_load_feedback = channels.get('gunnerus/RVG_mqtt/hcx_port_mp/LoadFeedback', 'kW')
+stbd_load_feedback = channels.get('gunnerus/RVG_mqtt/hcx_stbd_mp/LoadFeedback', 'kW')
 combined_load_feedback = port_load_feedback + stbd_load_feedback
 
-# Extract fuel consumption for Engine 1 and Engine 3
-engine1_fuel_consumption = filled_data['gunnerus/RVG_mqtt/Engine1/fuel_consumption'].values
-engine3_fuel_consumption = filled_data['gunnerus/RVG_mqtt/Engine3/fuel_consumption'].values
+# Extract fuel consumption for Engine 1 and Engine 3 in kilograms per hour, at the diesel density in powertrain.py
+engine1_fuel_consumption = channels.get('gunnerus/RVG_mqtt/Engine1/fuel_consumption', 'kg/h')
+engine3_fuel_consumption = channels.get('gunnerus/RVG_mqtt/Engine3/fuel_consumption', 'kg/h')
 
-# Total fuel consumption in kg per hour
-total_fuel_consumption_lph = engine1_fuel_consumption + engine3_fuel_consumption
-total_fuel_consumption_kgph = total_fuel_consumption_lph * 0.832
+# Total fuel consumption in kilograms per hour
+total_fuel_consumption_kgph = engine1_fuel_consumption + engine3_fuel_consumption
 
 # Calculate total energy efficiency (ηE)
-energy_density = 42 * 10**6
+energy_density = LHV
 total_energy_output_joules = combined_load_feedback * 10**3 * 3600
 total_energy_input_joules = total_fuel_consumption_kgph * energy_density
 total_energy_efficiency = (total_energy_output_joules / total_energy_input_joules) * 100
@@ -68,9 +59,10 @@ eta_p_route_1 = eta_p[:half_index]
 total_energy_efficiency_route_1 = total_energy_efficiency[:half_index]
 
 # Plotting η_p and Total Energy Efficiency for Route 1
+# Series are drawn as a min/max envelope of about 2000 points, which keeps the peaks
 plt.figure(figsize=(12, 6))
-plt.plot(time_route_1, eta_p_route_1, label='Power Efficiency (η_p) - Route 1', color='green')
-plt.plot(time_route_1, total_energy_efficiency_route_1, label='Total Energy Efficiency - Route 1', color='blue')
+plt.plot(*downsample(time_route_1, eta_p_route_1, 2000), label='Power Efficiency (η_p) - Route 1', color='green')
+plt.plot(*downsample(time_route_1, total_energy_efficiency_route_1, 2000), label='Total Energy Efficiency - Route 1', color='blue')
 plt.title('Power Efficiency (η_p) and Total Energy Efficiency for Route 1')
 plt.xlabel('Time (minutes from start)')
 plt.ylabel('Efficiency [%]')
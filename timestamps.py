@@ -0,0 +1,114 @@
+import calendar
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# Fixed RFC3339 layout written by the logger: 2024-09-10T06:26:26.826584191Z
+TIMESTAMP_LENGTH = 30
+SEPARATORS = {4: '-', 7: '-', 10: 'T', 13: ':', 16: ':', 19: '.', 29: 'Z'}
+DIGIT_POSITIONS = [i for i in range(TIMESTAMP_LENGTH - 1) if i not in SEPARATORS]
+
+# Marker for rows that could not be parsed, same bit pattern as NaT
+NAT = np.iinfo(np.int64).min
+
+DAYS_IN_MONTH = np.array([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def _number(digits, first, count):
+    # Combine `count` digit columns starting at `first` into one integer column
+    number = np.zeros(len(digits), dtype=np.int64)
+    for i in range(first, first + count):
+        number = number * 10 + digits[:, i]
+    return number
+
+
+def days_from_civil(year, month, day):
+    # Days since 1970-01-01 for a proleptic Gregorian date (H. Hinnant's algorithm)
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def parse_timestamps(values):
+    # Vectorized parse of the fixed layout straight to int64 epoch nanoseconds.
+    # Rows in any other layout get NAT.
+    # One extra character is kept so longer strings can be told apart from exact matches
+    text = np.asarray(values).astype(f'U{TIMESTAMP_LENGTH + 1}')
+    codes = text.view(np.uint32).reshape(len(text), TIMESTAMP_LENGTH + 1)
+
+    valid = codes[:, TIMESTAMP_LENGTH] == 0
+    for position, separator in SEPARATORS.items():
+        valid &= codes[:, position] == ord(separator)
+
+    digits = codes[:, DIGIT_POSITIONS].astype(np.int64) - ord('0')
+    valid &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+    digits[~valid] = 0
+
+    # Digit columns: YYYY MM DD hh mm ss fffffffff
+    year = _number(digits, 0, 4)
+    month = _number(digits, 4, 2)
+    day = _number(digits, 6, 2)
+    hour = _number(digits, 8, 2)
+    minute = _number(digits, 10, 2)
+    second = _number(digits, 12, 2)
+    nanosecond = _number(digits, 14, 9)
+
+    valid &= (month >= 1) & (month <= 12) & (hour < 24) & (minute < 60) & (second < 60)
+    valid &= (day >= 1) & (day <= DAYS_IN_MONTH[np.where(valid, month, 0)])
+    leap_year = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    valid &= ~((month == 2) & (day == 29) & ~leap_year)
+
+    seconds = days_from_civil(year, month, day) * 86400 + hour * 3600 + minute * 60 + second
+    epoch_ns = seconds * 1_000_000_000 + nanosecond
+    epoch_ns[~valid] = NAT
+    return epoch_ns
+
+
+def to_epoch_ns(values):
+    # Fast path for the logger layout, pandas for anything else.
+    # Returns the int64 nanoseconds plus the number of rows that needed the
+    # slow path and the number that could not be parsed at all (left as NAT).
+    values = np.asarray(values, dtype=object)
+    epoch_ns = parse_timestamps(values)
+    other = np.flatnonzero(epoch_ns == NAT)
+    if len(other) == 0:
+        return epoch_ns, 0, 0
+
+    parsed = pd.to_datetime(pd.Series(values[other]), errors='coerce', utc=True, format='ISO8601')
+    fallback_ns = parsed.dt.as_unit('ns').to_numpy(dtype='datetime64[ns]').view(np.int64)
+    epoch_ns[other] = fallback_ns
+    n_invalid = int((fallback_ns == NAT).sum())
+    return epoch_ns, len(other), n_invalid
+
+
+def parse_timestamp(text):
+    # Scalar version for record-at-a-time streaming, epoch ns or NAT
+    text = text.strip()
+    if (len(text) == TIMESTAMP_LENGTH
+            and all(text[position] == separator for position, separator in SEPARATORS.items())):
+        try:
+            instant = datetime.datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                                        int(text[11:13]), int(text[14:16]), int(text[17:19]))
+            return calendar.timegm(instant.timetuple()) * 1_000_000_000 + int(text[20:29])
+        except ValueError:
+            pass
+    try:
+        instant = pd.Timestamp(text)
+    except ValueError:
+        return NAT
+    if instant is pd.NaT:
+        return NAT
+    instant = instant.tz_localize('UTC') if instant.tzinfo is None else instant.tz_convert('UTC')
+    return int(instant.as_unit('ns').value)
+
+
+def column_ns(timestamps):
+    # int64 epoch ns of a datetime column or index (naive values are taken as UTC)
+    index = pd.DatetimeIndex(timestamps)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    return index.as_unit('ns').asi8
@@ -0,0 +1,147 @@
+from collections import namedtuple
+
+import numpy as np
+
+from align import instant_ns
+from channels import ChannelRegistry, rated_scales
+from instrument import profiled
+from integrate import cumulative, gaps
+from powertrain import CO2_FACTOR, FUEL_DENSITY, THRUSTER_RATING
+from timestamps import column_ns
+
+HOUR_NS = 3600 * 10**9
+
+# Derived channels and the units of their rate and of their total over a window
+CHANNELS = {
+    'fuel': ('kg/h', 'kg'),
+    'propulsion_power': ('kW', 'kWh'),
+    'genset_power': ('kW', 'kWh'),
+    'co2': ('kg/h', 'kg'),
+}
+
+# Window statistics of one channel. Values hold until the next row, so
+#   total  integral of the rate over the window, e.g. kg from kg/h
+#   mean   time-weighted mean rate
+#   var    time-weighted variance of the rate
+#   hours  length of the window covered by the data
+WindowStats = namedtuple('WindowStats', ['total', 'mean', 'var', 'hours'])
+
+
+def _summed(frame, suffix, channels, unit, prefix='gunnerus/RVG_mqtt/'):
+    # Sum of every column like gunnerus/RVG_mqtt/<unit>/<suffix> in unit, missing readings as 0
+    names = [name for name in frame.columns
+             if isinstance(name, str) and name.startswith(prefix) and name.endswith(suffix)]
+    if not names:
+        return np.zeros(len(frame))
+    return np.nan_to_num(channels.materialize(frame, names, [unit] * len(names))).sum(axis=1)
+
+
+def derived_channels(frame, fuel_density=FUEL_DENSITY, thruster_rating=THRUSTER_RATING, co2_factor=CO2_FACTOR):
+    # The CHANNELS of a filled/aligned table, summed over the engines and thrusters present
+    channels = ChannelRegistry(rated=rated_scales(fuel_density, thruster_rating))
+    fuel = _summed(frame, '/fuel_consumption', channels, 'kg/h')
+    return {
+        'fuel': fuel,
+        'propulsion_power': _summed(frame, '/LoadFeedback', channels, 'kW'),
+        'genset_power': _summed(frame, '/engine_load', channels, 'kW'),
+        'co2': fuel * co2_factor,
+    }
+
+
+class Voyage:
+    # Derived channels of a filled/aligned table with prefix sums of the
+    # integral of each channel and of its square. Any time window is then
+    # answered in O(1) after a binary search, and many windows at once with
+    # one vectorized lookup, without rescanning the data.
+
+    def __init__(self, time, channels, max_gap=None):
+        # Intervals longer than max_gap are treated as missing data, see integrate.increments
+        self.time = np.asarray(time, dtype=np.int64)
+        if np.any(np.diff(self.time) < 0):
+            raise ValueError("Voyage time must be ascending")
+        self.max_gap = max_gap
+        # Interval after each row that holds data, 0 after the last row and across gaps
+        self._open = np.append(np.ones(max(len(self.time) - 1, 0)), 0.0)
+        if max_gap is not None and len(self.time):
+            self._open[:-1][gaps(self.time, max_gap)] = 0.0
+        # Hours of data from the first row to each row, the gaps left out
+        self._covered = np.append(0.0, np.cumsum(np.diff(self.time) * self._open[:-1])) / HOUR_NS
+        self.channels = {}
+        self._prefix = {}
+        for name, values in channels.items():
+            values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+            self.channels[name] = values
+            # Integral and integral of the square up to each row, starting at 0
+            self._prefix[name] = (cumulative(self.time, values, 'hold', max_gap),
+                                  cumulative(self.time, values * values, 'hold', max_gap))
+
+    @classmethod
+    @profiled('voyage', rows=len)
+    def from_frame(cls, frame, fuel_density=FUEL_DENSITY, thruster_rating=THRUSTER_RATING,
+                   co2_factor=CO2_FACTOR, max_gap=None):
+        channels = derived_channels(frame, fuel_density, thruster_rating, co2_factor)
+        return cls(column_ns(frame['timestamp']), channels, max_gap)
+
+    def __len__(self):
+        return len(self.time)
+
+    @property
+    def names(self):
+        return list(self.channels)
+
+    def _bound(self, instants, default):
+        # Epoch ns of window bounds, clipped to the data
+        if instants is None:
+            return np.array([default], dtype=np.int64)
+        if np.ndim(instants) == 0:
+            instants = [instants]
+        ns = np.array([instant_ns(instant) for instant in instants], dtype=np.int64)
+        return np.clip(ns, self.time[0], self.time[-1])
+
+    def _at(self, name, ns):
+        # Integral and integral of the square from the first row to each instant
+        integral, integral_sq = self._prefix[name]
+        values = self.channels[name]
+        row = np.searchsorted(self.time, ns, side='right') - 1
+        held = values[row] * self._open[row] * (ns - self.time[row]) / HOUR_NS
+        return integral[row] + held, integral_sq[row] + held * values[row]
+
+    def _hours_at(self, ns):
+        # Hours of data from the first row to each instant
+        row = np.searchsorted(self.time, ns, side='right') - 1
+        return self._covered[row] + self._open[row] * (ns - self.time[row]) / HOUR_NS
+
+    def cumulative(self, name):
+        # Running total of a channel at every row, e.g. kg of fuel since the start
+        return self._prefix[name][0]
+
+    def windows(self, starts=None, ends=None, names=None):
+        # WindowStats of arrays, one entry per [start, end) window, for each channel.
+        # Bounds may be timestamps or epoch ns; None means the start/end of the data.
+        if len(self.time) == 0:
+            raise ValueError("Voyage holds no data")
+        start = self._bound(starts, self.time[0])
+        end = self._bound(ends, self.time[-1])
+        start, end = np.broadcast_arrays(start, end)
+        # Only time with data counts: with max_gap, a window across a gap covers less than its span
+        hours = np.where(end > start, self._hours_at(end) - self._hours_at(start), 0.0)
+
+        stats = {}
+        for name in names or self.names:
+            lo, lo_sq = self._at(name, start)
+            hi, hi_sq = self._at(name, end)
+            total = np.where(hours > 0, hi - lo, 0.0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = total / hours
+                var = np.maximum((hi_sq - lo_sq) / hours - mean * mean, 0.0)
+            stats[name] = WindowStats(total, mean, var, hours)
+        return stats
+
+    def window(self, start=None, end=None, names=None):
+        # WindowStats of plain numbers for one window
+        return {name: WindowStats(*(float(field[0]) for field in stats))
+                for name, stats in self.windows(start, end, names).items()}
+
+    def segments(self, segments, names=None):
+        # WindowStats for a list of Segments, e.g. the routes from segments.transit_legs
+        return self.windows([s.start for s in segments], [s.end for s in segments], names)